@@ -0,0 +1,129 @@
+"""
+attempts表索引的基准测试：在临时模式中生成模拟练习数据，分别在建索引前后对练习历史、按题目和用户查询、错题查询执行
+EXPLAIN (ANALYZE, BUFFERS)，打印执行计划和耗时对比。索引由migrations/0001_attempt_indexes.sql创建，不影响业务表
+用法（在backend目录下）：
+    python -m benchmarks.attempt_indexes --rows 2000000
+"""
+import argparse
+from pathlib import Path
+import sqlparse
+from sqlalchemy import create_engine, text
+from src.config import settings
+
+BENCH_SCHEMA = "bench_attempt_indexes"
+MIGRATION = Path(__file__).resolve().parent.parent / "migrations" / "0001_attempt_indexes.sql"
+
+# 与crud/async_crud中的查询一致
+QUERIES = {
+    "练习历史": (
+        "SELECT * FROM attempts WHERE user_id = :user_id ORDER BY submitted_at DESC"
+    ),
+    "按题目和用户查询错误练习": (
+        "SELECT * FROM attempts WHERE question_id = :question_id AND user_id = :user_id "
+        "AND is_correct = false ORDER BY submitted_at DESC"
+    ),
+    "用户错题": (
+        "SELECT DISTINCT question_id FROM attempts WHERE user_id = :user_id AND is_correct = false"
+    ),
+    "全部错题": (
+        "SELECT DISTINCT question_id FROM attempts WHERE is_correct = false"
+    ),
+}
+
+
+def setup(conn, rows: int, users: int, questions: int):
+    """创建临时模式并生成数据：每个用户的练习分散在多道题上，约35%的练习为错误，提交时间逐条递减"""
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+    conn.execute(text(f"SET search_path TO {BENCH_SCHEMA}"))
+    conn.execute(text("""
+        CREATE TABLE attempts (
+            attempt_id varchar PRIMARY KEY,
+            user_id varchar,
+            question_id varchar,
+            student_sql text,
+            is_correct boolean,
+            error_type varchar,
+            submitted_at timestamp,
+            detailed_errors jsonb
+        )
+    """))
+    conn.execute(text("""
+        INSERT INTO attempts
+        SELECT 'a' || g,
+               'u' || (g % :users),
+               'q' || (((g / :users) * 7919 + g) % :questions),
+               'SELECT * FROM t WHERE id = ' || g,
+               (g * 2654435761) % 100 >= 35,
+               NULL,
+               now() - make_interval(secs => g),
+               NULL
+        FROM generate_series(1::bigint, :rows) AS g
+    """), {"rows": rows, "users": users, "questions": questions})
+    conn.execute(text("ANALYZE attempts"))
+
+
+def apply_migration(conn):
+    """在临时模式中执行迁移脚本（脚本中的表名未带模式前缀，按search_path解析到临时表）"""
+    for statement in sqlparse.split(MIGRATION.read_text(encoding="utf-8")):
+        sql = sqlparse.format(statement, strip_comments=True).strip().rstrip(";")
+        if sql:
+            conn.execute(text(sql))
+
+
+def explain(conn, sql: str, params: dict):
+    """返回(执行计划文本, 执行耗时毫秒)"""
+    lines = [row[0] for row in conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params)]
+    elapsed = next(float(line.split(":")[1].split()[0]) for line in lines if line.startswith("Execution Time"))
+    return "\n".join(lines), elapsed
+
+
+def run_queries(conn, params: dict, label: str) -> dict:
+    timings = {}
+    for name, sql in QUERIES.items():
+        text_plan, elapsed = explain(conn, sql, params)
+        timings[name] = elapsed
+        print(f"\n=== [{label}] {name}（{elapsed:.2f}ms）")
+        print(text_plan)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="attempts表索引基准测试")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="生成的练习数")
+    parser.add_argument("--users", type=int, default=5000, help="用户数")
+    parser.add_argument("--questions", type=int, default=500, help="题目数")
+    parser.add_argument("--keep", action="store_true", help="结束后保留临时模式")
+    args = parser.parse_args()
+
+    # CREATE INDEX CONCURRENTLY需要自动提交
+    engine = create_engine(settings.DATABASE_URL, isolation_level="AUTOCOMMIT")
+    try:
+        with engine.connect() as conn:
+            print(f"生成{args.rows}条练习数据...")
+            setup(conn, args.rows, args.users, args.questions)
+            user_id = "u42"
+            question_id = conn.execute(
+                text("SELECT question_id FROM attempts WHERE user_id = :user_id AND NOT is_correct LIMIT 1"),
+                {"user_id": user_id}
+            ).scalar()
+            params = {"user_id": user_id, "question_id": question_id}
+
+            before = run_queries(conn, params, "建索引前")
+            apply_migration(conn)
+            after = run_queries(conn, params, "建索引后")
+
+            print("\n=== 执行耗时对比（毫秒）")
+            print(f"{'查询':<16}{'建索引前':>12}{'建索引后':>12}{'加速比':>10}")
+            for name in QUERIES:
+                speedup = before[name] / after[name] if after[name] else float("inf")
+                print(f"{name:<16}{before[name]:>12.2f}{after[name]:>12.2f}{speedup:>9.1f}x")
+
+            if not args.keep:
+                conn.execute(text(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE"))
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
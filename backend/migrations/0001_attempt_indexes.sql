@@ -0,0 +1,18 @@
+-- 为attempts表补建索引（与models.Attempt.__table_args__一致）
+-- 使用CONCURRENTLY建索引不阻塞写入，需在事务块之外逐条执行（apply.py会以自动提交方式执行）
+-- 若建索引中途失败会留下INVALID索引，IF NOT EXISTS不会重建，需先DROP INDEX CONCURRENTLY后重新执行
+
+-- 练习历史：WHERE user_id = ? ORDER BY submitted_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_attempts_user_id_submitted_at
+    ON attempts (user_id, submitted_at);
+
+-- 按题目和用户查询：WHERE question_id = ? AND user_id = ? [AND is_correct = ?] ORDER BY submitted_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_attempts_question_user_correct_submitted
+    ON attempts (question_id, user_id, is_correct, submitted_at);
+
+-- 错题查询：WHERE [user_id = ? AND] is_correct = false
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_attempts_incorrect_user_question
+    ON attempts (user_id, question_id)
+    WHERE is_correct = false;
+
+ANALYZE attempts;
@@ -0,0 +1,3 @@
+-- 为attempts表补充details列（与models.Attempt.details一致），记录提交时是否要求逐行差异，重新判题时沿用
+-- 已有记录按默认的逐行差异模式处理
+ALTER TABLE attempts ADD COLUMN IF NOT EXISTS details boolean NOT NULL DEFAULT true;
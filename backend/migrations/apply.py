@@ -0,0 +1,54 @@
+"""
+执行数据库迁移脚本：按文件名顺序以自动提交方式执行migrations目录下的.sql文件（CREATE INDEX CONCURRENTLY不能在事务中执行）
+用法（在backend目录下）：
+    python -m migrations.apply                  # 执行全部脚本
+    python -m migrations.apply 0001_attempt_indexes.sql
+所有语句都是幂等的，可重复执行
+"""
+import sys
+from pathlib import Path
+import sqlparse
+from sqlalchemy import create_engine, text
+from src.config import settings
+
+MIGRATIONS_DIR = Path(__file__).parent
+
+
+def apply_file(conn, path: Path):
+    """逐条执行一个迁移脚本"""
+    print(f"== {path.name}")
+    for statement in sqlparse.split(path.read_text(encoding="utf-8")):
+        sql = sqlparse.format(statement, strip_comments=True).strip().rstrip(";")
+        if not sql:
+            continue
+        print(f"-> {sql.splitlines()[0]}")
+        conn.execute(text(sql))
+
+
+def report_invalid_indexes(conn):
+    """列出建索引失败留下的INVALID索引"""
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "JOIN pg_class t ON t.oid = i.indrelid "
+        "WHERE NOT i.indisvalid AND t.relname = 'attempts'"
+    )).all()
+    for (name,) in rows:
+        print(f"!! 索引{name}无效，请执行 DROP INDEX CONCURRENTLY {name}; 后重新运行迁移")
+    return not rows
+
+
+def main(names):
+    paths = [MIGRATIONS_DIR / name for name in names] if names else sorted(MIGRATIONS_DIR.glob("*.sql"))
+    engine = create_engine(settings.DATABASE_URL, isolation_level="AUTOCOMMIT")
+    try:
+        with engine.connect() as conn:
+            for path in paths:
+                apply_file(conn, path)
+            ok = report_invalid_indexes(conn)
+    finally:
+        engine.dispose()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
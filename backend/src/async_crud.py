@@ -0,0 +1,110 @@
+"""
+异步数据库访问对象层，提供高频接口（认证、题目列表、提交、练习历史）使用的异步查询
+"""
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src import models
+
+
+KNOWLEDGE_POINT_COLUMNS = {
+    "basic_query": models.Question.basic_query,
+    "where_clause": models.Question.where_clause,
+    "aggregation": models.Question.aggregation,
+    "group_by": models.Question.group_by,
+    "order_by": models.Question.order_by,
+    "limit_clause": models.Question.limit_clause,
+    "joins": models.Question.joins,
+    "subqueries": models.Question.subqueries,
+    "null_handling": models.Question.null_handling,
+    "execution_order": models.Question.execution_order
+}
+
+
+# 用户管理模块
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
+    """
+    通过用户名返回用户
+    参数：
+        db: 异步数据库会话
+        username: 用户名称
+    返回：
+        models.User: 用户实例
+    """
+    result = await db.execute(select(models.User).where(models.User.username == username).limit(1))
+    return result.scalars().first()
+
+
+# 题目管理模块
+async def get_question(db: AsyncSession, question_id: str) -> Optional[models.Question]:
+    """
+    根据question_id获取题目定义
+    参数：
+        db：异步数据库会话
+        question_id：问题id
+    返回：
+        models.Question：问题实例
+    """
+    return await db.get(models.Question, question_id)
+
+async def get_questions(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[models.Question]:
+    """
+    获得题目列表
+    参数：
+        db：异步数据库会话
+        skip：
+        limit：限制
+    返回：
+        list[models.Question]：题目列表
+    """
+    result = await db.execute(select(models.Question).offset(skip).limit(limit))
+    return list(result.scalars().all())
+
+async def get_questions_by_knowledge_point(db: AsyncSession, point_name: str) -> Optional[List[models.Question]]:
+    """
+    根据具体知识点名称查询题目
+    参数：
+        db：异步数据库会话
+        point_name：知识点名称
+    返回：
+        list[models.Question]：题目列表
+    """
+    if point_name not in KNOWLEDGE_POINT_COLUMNS:
+        return None
+    result = await db.execute(select(models.Question).where(KNOWLEDGE_POINT_COLUMNS[point_name] == True))
+    return list(result.scalars().all())
+
+
+# 练习管理模块
+async def get_user_attempts(db: AsyncSession, user_id: str) -> List[models.Attempt]:
+    """
+    获得指定user的所有练习
+    参数：
+        db：异步数据库会话
+        user_id：用户id
+    返回：
+        list[models.Attempt]：练习实例列表
+    """
+    result = await db.execute(
+        select(models.Attempt)
+        .where(models.Attempt.user_id == user_id)
+        .order_by(models.Attempt.submitted_at.desc())
+    )
+    return list(result.scalars().all())
+
+
+async def get_attempt_analysis(db: AsyncSession, attempt_id: str) -> Optional[tuple]:
+    """
+    获得练习的分析记录及练习所属用户
+    参数：
+        db：异步数据库会话
+        attempt_id：练习id
+    返回：
+        (models.AttemptAnalysis, user_id) or None
+    """
+    result = await db.execute(
+        select(models.AttemptAnalysis, models.Attempt.user_id)
+        .join(models.Attempt, models.Attempt.attempt_id == models.AttemptAnalysis.attempt_id)
+        .where(models.AttemptAnalysis.attempt_id == attempt_id)
+    )
+    return result.first()
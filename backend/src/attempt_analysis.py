@@ -0,0 +1,191 @@
+"""
+练习分析模块，准备LLM分析的输入（优先复用判题时已得到的查询结果），并在后台线程中生成分析写入attempt_analyses表
+"""
+import json
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+from src import crud, llm_utils
+from src.config import settings
+from src.database import SessionLocal, schema_pools
+from src.llm_cache import analysis_cache, analysis_cache_key, store_analysis
+from src.llm_dispatcher import LLMUnavailable
+from src.prompt_compaction import compact_analysis_context
+from src.schemas import SQLValidationResult
+from src.sandbox import QueryResult, execute_query, resolve_limits, governed_transaction
+
+logger = logging.getLogger(__name__)
+
+# 判题时学生SQL未执行或未执行完的错误类型，分析时直接把判题错误交给LLM，不再执行学生SQL
+UNEXECUTED_ERROR_TYPES = {
+    "syntax_error", "security_error", "semantic_error", "cost_rejected",
+    "timeout_error", "result_too_large", "execution_error", "runtime_error"
+}
+# 交给LLM的判题错误的最大字符数
+MAX_VERDICT_ERROR_CHARS = 2000
+
+
+def build_analysis_inputs(
+        question_id: str,
+        description: str,
+        answer_sql: str,
+        schema_definition: dict,
+        schema_name: str,
+        student_sql: str,
+        is_correct: bool,
+        student_query: Optional[QueryResult] = None,
+        answer_query: Optional[QueryResult] = None,
+        error_type: Optional[str] = None,
+        detailed_errors: Optional[List[dict]] = None
+) -> dict:
+    """
+    准备LLM分析的输入，未提供的查询结果在沙箱中执行获得
+    参数：
+        student_query：判题时得到的学生SQL结果
+        answer_query：判题时得到的参考答案结果
+        error_type：判题的错误类型，属于UNEXECUTED_ERROR_TYPES时不执行学生SQL
+        detailed_errors：判题的详细错误，代替学生SQL结果交给LLM
+    返回：
+        dict：LLMHelper.analyze_sql的参数
+    """
+    if student_query is None and error_type in UNEXECUTED_ERROR_TYPES:
+        # 判题时被拒绝、超时或执行失败的SQL再次执行结果相同，还会再占用一次沙箱
+        errors = json.dumps(detailed_errors or [], ensure_ascii=False, default=str)
+        student_query = f"未执行（判题错误类型：{error_type}）: {errors[:MAX_VERDICT_ERROR_CHARS]}"
+
+    if student_query is None or answer_query is None:
+        limits = resolve_limits(schema_definition, question_id)
+        with schema_pools.connect(schema_name) as conn, governed_transaction(conn, limits):
+            if answer_query is None:
+                answer_query = execute_query(conn, answer_sql, limits.max_rows, limits.max_bytes, truncate=True)
+            if student_query is None and is_correct:
+                # 答案正确（如走了指纹快速路径）时学生结果与参考答案一致，无需再执行
+                student_query = answer_query
+            elif student_query is None:
+                # 学生SQL可能无法执行，在保存点中执行并把错误交给LLM分析
+                try:
+                    with conn.begin_nested():
+                        student_query = execute_query(conn, student_sql, limits.max_rows, limits.max_bytes, truncate=True)
+                except Exception as e:
+                    student_query = f"执行失败: {str(e)}"
+
+    # 模式渲染为DDL，结果做首尾采样，控制在token预算内
+    context = compact_analysis_context(
+        schema_definition,
+        student_query,
+        answer_query,
+        settings.LLM_PROMPT_TOKEN_BUDGET,
+        fixed_text=str(description) + student_sql + answer_sql
+    )
+    return {
+        "question_description": str(description),
+        "student_sql": student_sql,
+        "answer_sql": answer_sql,
+        "is_correct": is_correct,
+        **context
+    }
+
+
+class AnalysisWorker:
+    """后台生成练习分析"""
+
+    def __init__(self, workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+        self._futures: Dict[Future, str] = {}      # 未完成的任务 -> 练习id
+        self._lock = threading.Lock()
+
+    def submit(self, attempt_id: str, question, schema, student_sql: str, verdict: SQLValidationResult, capture: dict = None):
+        """
+        提交分析任务（调用方需已创建pending状态的分析记录）
+        参数：
+            attempt_id：练习id
+            question：题目实例
+            schema：模式实例
+            student_sql：学生提交的sql
+            verdict：判题结果
+            capture：判题时得到的查询结果（快速路径或命中判题缓存时为空）
+        """
+        # ORM实例不跨线程使用，只传递需要的字段
+        future = self._executor.submit(
+            self._run,
+            attempt_id,
+            question.question_id,
+            question.description,
+            question.answer_sql,
+            schema.schema_definition,
+            schema.schema_name,
+            student_sql,
+            verdict.is_correct,
+            verdict.error_type,
+            verdict.detailed_errors,
+            capture or {}
+        )
+        with self._lock:
+            self._futures[future] = attempt_id
+        future.add_done_callback(self._forget)
+
+    def _forget(self, future: Future):
+        with self._lock:
+            self._futures.pop(future, None)
+
+    def _run(self, attempt_id, question_id, description, answer_sql, schema_definition, schema_name,
+             student_sql, is_correct, error_type, detailed_errors, capture):
+        db = SessionLocal()
+        try:
+            cache_key = analysis_cache_key(question_id, answer_sql, student_sql, is_correct)
+            analysis = analysis_cache.get(cache_key)
+            if analysis is None:
+                inputs = build_analysis_inputs(
+                    question_id, description, answer_sql, schema_definition, schema_name,
+                    student_sql, is_correct, capture.get("student"), capture.get("answer"),
+                    error_type, detailed_errors
+                )
+                analysis = llm_utils.get_llm_helper().analyze_sql(**inputs)
+                if analysis.get("correctness_analysis") == llm_utils.ANALYSIS_FAILED:
+                    crud.finish_attempt_analysis(db, attempt_id, error="LLM分析失败")
+                    return
+                store_analysis(cache_key, analysis)
+            crud.finish_attempt_analysis(db, attempt_id, analysis=analysis)
+        except LLMUnavailable as e:
+            crud.finish_attempt_analysis(db, attempt_id, error=str(e))
+        except Exception as e:
+            logger.error(f"练习分析失败: {str(e)}", exc_info=True)
+            db.rollback()
+            crud.finish_attempt_analysis(db, attempt_id, error=str(e))
+        finally:
+            db.close()
+
+    def recover(self):
+        """
+        启动时将所有未完成的分析标记为失败，避免前端一直等待
+        分析任务只存在于进程内的线程池中，启动时的pending记录都来自上次进程，已不会再被执行
+        """
+        db = SessionLocal()
+        try:
+            count = crud.fail_pending_attempt_analyses(db, error="服务重启，分析未完成")
+            if count:
+                logger.info(f"已将{count}条未完成的分析标记为失败")
+        except Exception as e:
+            logger.error(f"清理未完成的分析失败: {str(e)}", exc_info=True)
+        finally:
+            db.close()
+
+    def shutdown(self):
+        """停止接收任务，排队中的任务取消并将其分析记录标记为失败（执行中的任务继续完成）"""
+        with self._lock:
+            futures = dict(self._futures)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        cancelled = [attempt_id for future, attempt_id in futures.items() if future.cancelled()]
+        if not cancelled:
+            return
+        db = SessionLocal()
+        try:
+            crud.fail_pending_attempt_analyses(db, error="服务关闭，分析未完成", attempt_ids=cancelled)
+        except Exception as e:
+            logger.error(f"标记取消的分析失败: {str(e)}", exc_info=True)
+        finally:
+            db.close()
+
+
+analysis_worker = AnalysisWorker(settings.ANALYSIS_WORKERS)
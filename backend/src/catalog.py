@@ -0,0 +1,82 @@
+"""
+模式目录模块，将模式定义编译为基于frozenset的表、列查找结构，并按模式id和版本缓存
+"""
+from dataclasses import dataclass
+from typing import Dict, FrozenSet
+from src.config import settings
+from src.grading_cache import LRUCache, schema_version
+
+EMPTY: FrozenSet[str] = frozenset()
+
+
+@dataclass(frozen=True)
+class SchemaCatalog:
+    """编译后的模式目录，表名同时以完整名称和简单名称登记"""
+    schema_name: str                                # 模式名称
+    tables: FrozenSet[str]                          # 所有可用表名
+    columns: Dict[str, FrozenSet[str]]              # 表名 -> 列名集合
+    column_tables: Dict[str, FrozenSet[str]]        # 列名 -> 含有该列的表（简单名称）
+
+    def has_table(self, table: str) -> bool:
+        return table in self.tables
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in self.columns.get(table, EMPTY)
+
+    def tables_with_column(self, column: str) -> FrozenSet[str]:
+        return self.column_tables.get(column, EMPTY)
+
+
+def compile_catalog(schema_definition: dict, schema_name: str) -> SchemaCatalog:
+    """
+    编译模式定义
+    参数：
+        schema_definition：模式定义
+        schema_name：模式名称
+    返回：
+        SchemaCatalog：模式目录
+    """
+    columns = {}
+    column_tables = {}
+    for table in (schema_definition or {}).get("tables", []):
+        full_name = table["name"]
+        simple_name = full_name.split('.')[-1]
+        table_columns = frozenset(col["name"] for col in table.get("columns", []))
+        columns[full_name] = table_columns
+        columns[simple_name] = table_columns
+        for column in table_columns:
+            column_tables.setdefault(column, set()).add(simple_name)
+    return SchemaCatalog(
+        schema_name=schema_name,
+        tables=frozenset(columns),
+        columns=columns,
+        column_tables={column: frozenset(tables) for column, tables in column_tables.items()}
+    )
+
+
+catalog_cache = LRUCache(settings.CATALOG_CACHE_MAX_ENTRIES, max_bytes=float("inf"))
+
+
+def get_catalog(schema_id: str, schema_definition: dict, schema_name: str) -> SchemaCatalog:
+    """
+    获取模式目录，按(模式id, 模式版本)缓存；未提供模式id时直接编译
+    参数：
+        schema_id：模式id
+        schema_definition：模式定义
+        schema_name：模式名称
+    返回：
+        SchemaCatalog：模式目录
+    """
+    if schema_id is None:
+        return compile_catalog(schema_definition, schema_name)
+    key = (schema_id, schema_version(schema_id))
+    catalog = catalog_cache.get(key)
+    if catalog is None:
+        catalog = compile_catalog(schema_definition, schema_name)
+        catalog_cache.set(key, catalog)
+    return catalog
+
+
+def invalidate_catalog(schema_id: str):
+    """模式更新或删除后清除该模式的目录"""
+    catalog_cache.invalidate(lambda key: key[0] == schema_id)
@@ -0,0 +1,137 @@
+"""
+结果比较模块，在进程内以哈希多重集（行 -> 出现次数）比较两个查询结果，用于顺序不敏感的判题
+"""
+import json
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, List, Sequence
+from uuid import UUID
+
+
+@dataclass(frozen=True)
+class TaggedValue:
+    """带类型标记的规范值：布尔值不与整数相等，NaN与自身相等，正负无穷不参与整数转换"""
+    tag: str                                # bool / nan / inf
+    value: object                           # 展示用的值
+
+
+def _is_finite(value) -> bool:
+    return value.is_finite() if isinstance(value, Decimal) else math.isfinite(value)
+
+
+def _is_nan(value) -> bool:
+    return value.is_nan() if isinstance(value, Decimal) else math.isnan(value)
+
+
+def canonicalize_value(value):
+    """
+    将单元格的值转换为可哈希且与类型表示无关的规范形式
+    参数：
+        value：数据库返回的值
+    返回：
+        规范化后的可哈希值
+    """
+    if isinstance(value, bool):
+        return TaggedValue("bool", value)
+    if isinstance(value, (Decimal, float)) and not _is_finite(value):
+        if _is_nan(value):
+            return TaggedValue("nan", "NaN")
+        return TaggedValue("inf", "Infinity" if value > 0 else "-Infinity")
+    if isinstance(value, Decimal):
+        # 整数值的Decimal与int哈希一致，非整数值转为float以便与浮点列比较
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(canonicalize_value(v) for v in value)
+    if isinstance(value, dict):
+        return json.dumps(value, sort_keys=True, default=str)
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    return value
+
+
+def canonicalize_row(row: Sequence) -> tuple:
+    """规范化一整行"""
+    return tuple(canonicalize_value(v) for v in row)
+
+
+def build_multiset(rows: Sequence[Sequence]) -> Counter:
+    """
+    一次遍历构建行的哈希多重集
+    参数：
+        rows：结果行
+    返回：
+        Counter：规范化行 -> 出现次数
+    """
+    return Counter(canonicalize_row(row) for row in rows)
+
+
+def _display_value(value):
+    """将值转换为可JSON序列化的展示形式"""
+    if isinstance(value, TaggedValue):
+        return value.value
+    if isinstance(value, (date, datetime, time, timedelta, UUID)):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, tuple):
+        return [_display_value(v) for v in value]
+    return value
+
+
+@dataclass
+class MultisetDiff:
+    """两个结果多重集的差异"""
+    missing_rows: List[dict] = field(default_factory=list)      # 参考答案中有而学生结果中缺少的行
+    extra_rows: List[dict] = field(default_factory=list)        # 学生结果中多出的行
+    missing_count: int = 0                                      # 缺少的行数（计入重复）
+    extra_count: int = 0                                        # 多出的行数（计入重复）
+
+    @property
+    def is_equal(self) -> bool:
+        return self.missing_count == 0 and self.extra_count == 0
+
+
+def _row_report(row: tuple, columns: Sequence[str], count: int) -> Dict:
+    if len(columns) == len(row):
+        values = {col: _display_value(v) for col, v in zip(columns, row)}
+    else:
+        values = [_display_value(v) for v in row]
+    return {"row": values, "count": count}
+
+
+def compare_multisets(
+        student_rows: Sequence[Sequence],
+        answer_rows: Sequence[Sequence],
+        student_columns: Sequence[str],
+        answer_columns: Sequence[str],
+        max_report_rows: int
+) -> MultisetDiff:
+    """
+    比较两个结果的多重集，重复行的次数也参与比较
+    参数：
+        student_rows：学生SQL结果行
+        answer_rows：参考答案结果行
+        student_columns：学生SQL结果列名
+        answer_columns：参考答案结果列名
+        max_report_rows：缺失行和多余行各自最多报告的条数
+    返回：
+        MultisetDiff：差异信息
+    """
+    student_set = build_multiset(student_rows)
+    answer_set = build_multiset(answer_rows)
+
+    diff = MultisetDiff()
+    for row, count in (answer_set - student_set).items():
+        diff.missing_count += count
+        if len(diff.missing_rows) < max_report_rows:
+            diff.missing_rows.append(_row_report(row, answer_columns, count))
+    for row, count in (student_set - answer_set).items():
+        diff.extra_count += count
+        if len(diff.extra_rows) < max_report_rows:
+            diff.extra_rows.append(_row_report(row, student_columns, count))
+    return diff
@@ -1,6 +1,7 @@
 """
 一些基本设置
 """
+from typing import Optional
 from pydantic_settings import BaseSettings
 import dotenv
 import os
@@ -14,6 +15,88 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")                                   # LLM-API-KEY
     MODEL_BASE_URL: str = os.getenv("BASE_URL")                                         # LLM地址
     DATABASE_URL: str = os.getenv("DATABASE_URL")                                       # 数据库连接
+    ASYNC_DATABASE_URL: Optional[str] = os.getenv("ASYNC_DATABASE_URL")                 # 异步数据库连接，为空时由DATABASE_URL推导
+    ASYNC_POOL_SIZE: int = 10                                                           # 异步连接池常驻连接数
+    ASYNC_MAX_OVERFLOW: int = 10                                                        # 异步连接池允许的额外连接数
     MAX_ROWS: int = 1000  # 限制查询返回行数
 
+    # LLM客户端（应用启动时创建一次，复用HTTP连接）
+    LLM_MODEL: str = "deepseek-reasoner"                                                # 模型名称
+    LLM_TEMPERATURE: float = 0.5                                                        # 采样温度
+    LLM_TIMEOUT: float = 120                                                            # 单次请求超时（秒）
+    LLM_MAX_CONNECTIONS: int = 50                                                       # HTTP连接池最大连接数
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20                                             # 保持存活的空闲连接数
+    LLM_KEEPALIVE_EXPIRY: float = 60                                                    # 空闲连接保持时间（秒）
+    LLM_BACKEND: str = "openai"                                                         # 模型后端："openai" / "fake"（本地模拟，用于压测）
+    FAKE_LLM_LATENCY_MEAN: float = 1.0                                                  # 模拟后端首token前的平均延迟（秒）
+    FAKE_LLM_LATENCY_STDDEV: float = 0.5                                                # 模拟延迟的标准差（秒），按对数正态分布采样
+    FAKE_LLM_TOKENS_PER_SECOND: float = 50                                              # 模拟后端的生成速度
+    FAKE_LLM_SEED: Optional[int] = None                                                 # 模拟后端的随机种子
+    LLM_MAX_IN_FLIGHT: int = 16                                                         # 同时进行的LLM调用数上限
+    LLM_MAX_WAITING: int = 200                                                          # 等待LLM调用名额的队列长度上限
+    LLM_RETRY_AFTER: int = 10                                                           # 队列满时建议客户端重试的间隔（秒）
+    LLM_ANALYSIS_DEADLINE: float = 90                                                   # 一次SQL分析（含排队）的截止时间（秒）
+    LLM_GENERATION_DEADLINE: float = 180                                                # 一次题目生成（含排队）的截止时间（秒）
+    LLM_PROMPT_TOKEN_BUDGET: int = 4000                                                 # 提示中模式定义、查询结果等可变内容的token预算
+    ANALYSIS_WORKERS: int = 4                                                           # 后台生成练习分析的工作线程数
+    QUESTION_BATCH_MAX_ITEMS: int = 20                                                  # 批量生成题目时单次请求的最大条数
+    QUESTION_BATCH_CONCURRENCY: int = 4                                                 # 批量生成时同时进行的生成数
+    QUESTION_VALIDATION_TIMEOUT_MS: int = 3000                                          # 校验生成的参考答案时的语句超时（毫秒）
+    MAX_RESULT_BYTES: int = 8 * 1024 * 1024                                             # 限制单个查询结果占用的内存（字节）
+    FETCH_CHUNK_SIZE: int = 200                                                         # 流式读取结果时每批获取的行数
+
+    # LLM分析结果缓存
+    LLM_CACHE_BACKEND: str = "memory"                                                   # 缓存后端："memory" / "redis" / "none"
+    LLM_CACHE_TTL: int = 7 * 24 * 3600                                                  # 缓存有效期（秒）
+    LLM_CACHE_MAX_ENTRIES: int = 5000                                                   # 进程内缓存的最大条目数
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")                 # Redis连接
+
+    # 沙箱查询资源限制（可在模式定义的execution_limits中按模式或题目覆盖）
+    SANDBOX_STATEMENT_TIMEOUT_MS: int = 5000                                            # 单条语句最长执行时间（毫秒）
+    SANDBOX_LOCK_TIMEOUT_MS: int = 1000                                                 # 等待锁的最长时间（毫秒）
+    SANDBOX_WORK_MEM: str = "16MB"                                                      # 排序、哈希可使用的内存
+    SANDBOX_IDLE_IN_TRANSACTION_TIMEOUT_MS: int = 10000                                 # 事务空闲超时（毫秒）
+    SANDBOX_MAX_PLAN_COST: Optional[float] = None                                       # 执行前EXPLAIN预估总代价上限，为空时不检查
+    SANDBOX_MAX_PLAN_ROWS: Optional[float] = None                                       # 执行前EXPLAIN预估结果行数上限，为空时不检查
+    PLAN_CACHE_MAX_ENTRIES: int = 4096                                                  # 执行计划摘要的最大缓存数
+
+    # 判题连接池（与ORM元数据连接池相互独立，按样例模式划分，以下大小均为每个模式的连接池）
+    # 最坏情况下的连接总数为 GRADING_MAX_SCHEMA_POOLS*(GRADING_POOL_SIZE+GRADING_MAX_OVERFLOW)
+    # + ASYNC_POOL_SIZE + ASYNC_MAX_OVERFLOW + 15（同步ORM连接池），需小于PostgreSQL的max_connections（默认100）
+    GRADING_MAX_SCHEMA_POOLS: int = 6                                                   # 同时保留连接池的模式数量上限（LRU淘汰）
+    GRADING_POOL_SIZE: int = 2                                                          # 常驻连接数
+    GRADING_MAX_OVERFLOW: int = 6                                                       # 高峰期允许的额外连接数
+    GRADING_POOL_TIMEOUT: int = 10                                                      # 等待空闲连接的超时时间（秒）
+    GRADING_POOL_RECYCLE: int = 1800                                                    # 连接回收周期（秒）
+    GRADING_POOL_PRE_PING: bool = True                                                  # 取出连接前检测可用性
+
+    # 判题队列
+    GRADING_WORKERS: int = 8                                                            # 判题工作线程数（不应超过判题连接池容量）
+    GRADING_QUEUE_MAX_PENDING: int = 500                                                # 排队和执行中的任务上限，超出后拒绝提交
+    GRADING_JOB_TTL: int = 600                                                          # 已完成任务的保留时间（秒）
+    GRADING_RETRY_AFTER: int = 5                                                        # 队列已满时建议客户端重试的间隔（秒）
+    GRADING_SUBMIT_TIMEOUT: int = 60                                                    # 同步提交接口等待判题完成的最长时间（秒）
+    GRADING_LONG_POLL_MAX: int = 30                                                     # 查询任务状态时最长等待时间（秒）
+
+    # 批量重新判题
+    REGRADE_BATCH_SIZE: int = 500                                                       # 每批读取和更新的练习记录数
+    REGRADE_WORKERS: int = 4                                                            # 并行判题的线程数
+    REGRADE_JOB_TTL: int = 3600                                                         # 已完成任务的保留时间（秒）
+
+    # 参考答案结果缓存
+    REFERENCE_CACHE_MAX_ENTRIES: int = 512                                              # 最大缓存条目数
+    REFERENCE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024                                   # 缓存占用内存上限（字节）
+
+    SQL_ANALYSIS_CACHE_MAX_ENTRIES: int = 4096                                          # SQL解析结果的最大缓存数
+    SQL_ANALYSIS_CACHE_MAX_BYTES: int = 32 * 1024 * 1024                                # SQL解析结果缓存占用内存上限（字节）
+    CATALOG_CACHE_MAX_ENTRIES: int = 256                                                # 编译后模式目录的最大缓存数
+
+    # 判题结果缓存（相同题目下规范化后相同的提交直接复用判题结果）
+    VERDICT_CACHE_MAX_ENTRIES: int = 10000                                              # 最大缓存条目数
+    VERDICT_CACHE_MAX_BYTES: int = 32 * 1024 * 1024                                     # 缓存占用内存上限（字节）
+
+    GRADING_FINGERPRINT_FAST_PATH: bool = True                                          # 顺序不敏感题目先在数据库端比较结果指纹
+
+    COMPARISON_MAX_DIFF_ROWS: int = 20                                                  # 结果比较时最多报告的差异行数
+
 settings = Settings()
\ No newline at end of file
@@ -5,7 +5,8 @@ from typing import List
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime
-from src import models, schemas
+from src import models, schemas, grading_cache, catalog
+from src.database import schema_pools, schema_identifier
 import uuid
 import sqlparse
 import random
@@ -63,7 +64,8 @@ def execute_sql_with_current_connection(db: Session, sql_statements: str):
         元组（是否执行成功，错误消息）
     """
     try:
-        for statement in sqlparse.split(sql_statements):  # 使用sqlparse智能分割
+        # 初始化脚本只执行一次且可能很长，直接分割语句，不经过带缓存的完整解析（get_analysis只用于学生和参考答案SQL）
+        for statement in sqlparse.split(sql_statements):
             if statement.strip():
                 db.execute(text(statement))
         return True, None
@@ -130,6 +132,8 @@ def update_schema(db: Session, schema_id: str, schema: schemas.SampleSchemaUpdat
             setattr(db_schema, key, value)
         db.commit()
         db.refresh(db_schema)
+        grading_cache.invalidate_schema(schema_id)
+        catalog.invalidate_catalog(schema_id)
     return db_schema
 
 def delete_schema(db: Session, schema_id: str):
@@ -148,7 +152,7 @@ def delete_schema(db: Session, schema_id: str):
     try:
         #删除模式信息的同时删除创建的模式
         schema_name = schema.schema_name  # 从元数据中获取模式名
-        drop_schema_sql = f"DROP SCHEMA IF EXISTS {schema_name} CASCADE;"
+        drop_schema_sql = f"DROP SCHEMA IF EXISTS {schema_identifier(schema_name)} CASCADE;"
 
         #执行删除命令
         success, error_msg = execute_sql_with_current_connection(db, drop_schema_sql)
@@ -158,6 +162,9 @@ def delete_schema(db: Session, schema_id: str):
         #删除元数据记录
         db.delete(schema)
         db.commit()
+        schema_pools.dispose(schema_name)
+        grading_cache.invalidate_schema(schema_id)
+        catalog.invalidate_catalog(schema_id)
         return schema
     except Exception as e:
         db.rollback()
@@ -214,6 +221,33 @@ def create_question(db: Session, question: schemas.QuestionCreate):
     db.refresh(db_question)
     return db_question
 
+def create_questions_bulk(db: Session, questions: List[schemas.QuestionCreate]) -> List[models.Question]:
+    """
+    在一个事务中批量创建题目
+    参数：
+        db：数据库
+        questions：题目创建类列表
+    返回：
+        List[models.Question]：按输入顺序排列的题目实例
+    """
+    now = datetime.now()
+    db_questions = [
+        models.Question(
+            question_id=str(uuid.uuid4()),
+            created_at=now,
+            updated_at=now,
+            **question.model_dump()
+        )
+        for question in questions
+    ]
+    db.add_all(db_questions)
+    db.commit()
+
+    # 一次查询刷新所有新题目，避免逐条refresh
+    ids = [q.question_id for q in db_questions]
+    loaded = {q.question_id: q for q in db.query(models.Question).filter(models.Question.question_id.in_(ids))}
+    return [loaded[question_id] for question_id in ids]
+
 def get_question(db: Session, question_id: str):
     """
     根据question_id获取题目定义
@@ -242,6 +276,7 @@ def update_question(db: Session, question_id: str, question: schemas.QuestionCre
         db_question.updated_at = datetime.now()
         db.commit()
         db.refresh(db_question)
+        grading_cache.invalidate_question(question_id)
     return db_question
 
 def get_questions_by_knowledge_point(db: Session, point_name: str):
@@ -352,6 +387,7 @@ def create_attempt(db: Session, attempt: schemas.AttemptCreate):
         is_correct=attempt.is_correct,
         error_type=attempt.error_type,
         detailed_errors=attempt.detailed_errors,
+        details=attempt.details,
         submitted_at=datetime.now()
     )
     db.add(db_attempt)
@@ -359,6 +395,62 @@ def create_attempt(db: Session, attempt: schemas.AttemptCreate):
     db.refresh(db_attempt)
     return db_attempt
 
+def create_attempt_analysis(db: Session, attempt_id: str):
+    """
+    为练习创建待完成的分析记录
+    参数：
+        db：数据库
+        attempt_id：练习id
+    返回：
+        models.AttemptAnalysis：分析实例
+    """
+    db_analysis = models.AttemptAnalysis(
+        attempt_id=attempt_id,
+        status="pending",
+        created_at=datetime.now()
+    )
+    db.add(db_analysis)
+    db.commit()
+    return db_analysis
+
+def finish_attempt_analysis(db: Session, attempt_id: str, analysis: dict = None, error: str = None):
+    """
+    写入分析结果，error不为空时标记为失败
+    参数：
+        db：数据库
+        attempt_id：练习id
+        analysis：分析结果
+        error：失败原因
+    """
+    db.query(models.AttemptAnalysis).filter(models.AttemptAnalysis.attempt_id == attempt_id).update({
+        "status": "failed" if error else "done",
+        "analysis": analysis,
+        "error": error,
+        "finished_at": datetime.now()
+    })
+    db.commit()
+
+def fail_pending_attempt_analyses(db: Session, error: str, attempt_ids: List[str] = None) -> int:
+    """
+    将未完成的分析记录标记为失败
+    参数：
+        db：数据库
+        error：失败原因
+        attempt_ids：只处理这些练习的记录，为None时处理全部未完成的记录
+    返回：
+        int：标记的记录数
+    """
+    query = db.query(models.AttemptAnalysis).filter(models.AttemptAnalysis.status == "pending")
+    if attempt_ids is not None:
+        query = query.filter(models.AttemptAnalysis.attempt_id.in_(attempt_ids))
+    count = query.update({
+        "status": "failed",
+        "error": error,
+        "finished_at": datetime.now()
+    }, synchronize_session=False)
+    db.commit()
+    return count
+
 def get_user_attempts(db: Session, user_id: str):
     """
     获得指定user的所有练习
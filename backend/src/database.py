@@ -1,7 +1,12 @@
 """
 数据库和会话管理核心模块，功能为创建数据库引擎、会话工厂和提供数据库会话的依赖项
 """
-from sqlalchemy import create_engine
+import re
+import threading
+from collections import OrderedDict
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from src.config import settings
@@ -12,6 +17,115 @@ engine = create_engine(settings.DATABASE_URL)
 # 创建会话工厂，禁止自动提交，禁止自动刷新，绑定到上文创建的数据库引擎
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 未加引号的PostgreSQL标识符
+_UNQUOTED_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_$]*$")
+
+
+def schema_identifier(schema_name: str) -> str:
+    """
+    将模式名称转换为SQL中的标识符，与初始化SQL中未加引号的模式名解析方式一致（PostgreSQL将其折叠为小写）
+    参数：
+        schema_name：模式名称
+    返回：
+        str：加引号的小写标识符
+    异常：
+        ValueError：模式名称不是合法的标识符
+    """
+    if not _UNQUOTED_IDENTIFIER.match(schema_name or ""):
+        raise ValueError(f"模式名称不是合法的标识符: {schema_name}")
+    return f'"{schema_name.lower()}"'
+
+
+class SchemaPools:
+    """
+    按样例模式划分的判题连接池，进程内共享，用于执行学生SQL和参考答案SQL
+    与SessionLocal使用的连接池相互独立，避免沙箱查询耗尽ORM连接；
+    每个连接只在创建时设置一次search_path并确认模式存在，执行查询前无需再设置
+    """
+
+    def __init__(self, max_pools: int):
+        self.max_pools = max_pools
+        self._engines: "OrderedDict[str, Engine]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, schema_name: str) -> Engine:
+        """获取模式对应的引擎，超过上限时淘汰最近最少使用的连接池"""
+        with self._lock:
+            engine_ = self._engines.get(schema_name)
+            if engine_ is not None:
+                self._engines.move_to_end(schema_name)
+                return engine_
+            engine_ = self._create_engine(schema_name)
+            self._engines[schema_name] = engine_
+            evicted = []
+            while len(self._engines) > self.max_pools:
+                evicted.append(self._engines.popitem(last=False)[1])
+        for old in evicted:
+            old.dispose()       # 关闭空闲连接，已取出的连接归还后随旧连接池一起释放
+        return engine_
+
+    def connect(self, schema_name: str) -> Connection:
+        """从模式对应的连接池取出连接"""
+        return self.get(schema_name).connect()
+
+    def dispose(self, schema_name: str):
+        """模式删除后释放其连接池"""
+        with self._lock:
+            engine_ = self._engines.pop(schema_name, None)
+        if engine_ is not None:
+            engine_.dispose()
+
+    def dispose_all(self):
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+        for engine_ in engines:
+            engine_.dispose()
+
+    @staticmethod
+    def _create_engine(schema_name: str) -> Engine:
+        engine_ = create_engine(
+            settings.DATABASE_URL,
+            pool_size=settings.GRADING_POOL_SIZE,
+            max_overflow=settings.GRADING_MAX_OVERFLOW,
+            pool_timeout=settings.GRADING_POOL_TIMEOUT,
+            pool_recycle=settings.GRADING_POOL_RECYCLE,
+            pool_pre_ping=settings.GRADING_POOL_PRE_PING,
+        )
+        search_path = schema_identifier(schema_name)
+
+        @event.listens_for(engine_, "connect")
+        def set_search_path(dbapi_connection, connection_record):
+            # 建立连接时设置一次会话级search_path；沙箱事务结束时都会回滚，查询无法改变它
+            # current_schema()返回search_path中第一个存在的模式，为空说明模式不存在，连接建立失败
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute(f"SET search_path TO {search_path}")
+                cursor.execute("SELECT current_schema()")
+                current = cursor.fetchone()[0]
+            finally:
+                cursor.close()
+            dbapi_connection.commit()
+            if current is None:
+                dbapi_connection.close()        # 抛出异常后连接池不会再管理该连接
+                raise RuntimeError(f"模式{schema_name}不存在")
+
+        return engine_
+
+
+schema_pools = SchemaPools(settings.GRADING_MAX_SCHEMA_POOLS)
+
+# 创建异步引擎（asyncpg驱动），供高并发的异步路由使用
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg"),
+    pool_size=settings.ASYNC_POOL_SIZE,
+    max_overflow=settings.ASYNC_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
+
+# 创建异步会话工厂，提交后不过期对象，便于会话关闭后序列化返回
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # 创建ORM基类，用于models中定义数据库表结构中对应的python类
 Base = declarative_base()
 
@@ -21,4 +135,9 @@ def get_db():
     try:
         yield db        # 将会话提供给调用的函数使用
     finally:
-        db.close()      # 使用后关闭
\ No newline at end of file
+        db.close()      # 使用后关闭
+
+# 异步数据库会话依赖项
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db        # 退出上下文时自动关闭
@@ -0,0 +1,116 @@
+"""
+本地模拟的LLM后端，用于无网络环境下的压测：按配置的延迟分布和生成速度返回符合输出模型的固定JSON
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, Iterator, AsyncIterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+from src.prompt_compaction import estimate_tokens
+
+# 每个模拟token对应的字符数
+CHARS_PER_TOKEN = 4
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    模拟的聊天模型
+    参数：
+        latency_mean：首个token前的平均等待时间（秒）
+        latency_stddev：等待时间的标准差（秒），大于0时按对数正态分布采样，呈现长尾
+        tokens_per_second：生成速度
+        seed：随机种子，相同种子下延迟序列可复现
+    """
+    latency_mean: float = 1.0
+    latency_stddev: float = 0.5
+    tokens_per_second: float = 50.0
+    seed: Optional[int] = None
+
+    _random: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any):
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _sample_latency(self) -> float:
+        """采样首token延迟"""
+        if self.latency_stddev <= 0 or self.latency_mean <= 0:
+            return max(self.latency_mean, 0.0)
+        # 由均值和标准差换算对数正态分布的参数
+        sigma2 = math.log(1 + (self.latency_stddev / self.latency_mean) ** 2)
+        mu = math.log(self.latency_mean) - sigma2 / 2
+        with self._lock:
+            return self._random.lognormvariate(mu, math.sqrt(sigma2))
+
+    def _respond(self, messages: List[BaseMessage]) -> tuple:
+        """根据提示内容返回(输出文本, 输入token数)"""
+        prompt = "\n".join(str(m.content) for m in messages)
+        if "correctness_analysis" in prompt:
+            output = {
+                "correctness_analysis": "模拟分析：查询结果与参考答案" + ("一致。" if re.search(r"答案是否正确：\s*True", prompt) else "存在差异，请检查筛选条件和连接方式。"),
+                "optimization_suggestions": "模拟建议：只选择需要的列，并为过滤条件涉及的列建立索引。",
+                "thinking_difference": "模拟对比：两种写法的整体思路相近，区别在于条件的组织方式。"
+            }
+        else:
+            # 使用提示中出现的第一个表，保证生成的参考答案能在样例模式上执行
+            match = re.search(r"CREATE TABLE\s+([\w.]+)", prompt)
+            table = match.group(1) if match else None
+            output = {
+                "question_title": "模拟题目",
+                "description": f"查询{table}表中的前10条记录。" if table else "查询常量1。",
+                "answer_sql": f"SELECT * FROM {table} LIMIT 10" if table else "SELECT 1 AS answer"
+            }
+        return json.dumps(output, ensure_ascii=False), estimate_tokens(prompt)
+
+    @staticmethod
+    def _chunks(text: str) -> List[str]:
+        return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    @staticmethod
+    def _usage(input_tokens: int, output_tokens: int) -> dict:
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text, input_tokens = self._respond(messages)
+        chunks = self._chunks(text)
+        time.sleep(self._sample_latency() + len(chunks) / self.tokens_per_second)
+        message = AIMessage(content=text, usage_metadata=self._usage(input_tokens, len(chunks)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text, input_tokens = self._respond(messages)
+        chunks = self._chunks(text)
+        await asyncio.sleep(self._sample_latency() + len(chunks) / self.tokens_per_second)
+        message = AIMessage(content=text, usage_metadata=self._usage(input_tokens, len(chunks)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text, input_tokens = self._respond(messages)
+        chunks = self._chunks(text)
+        time.sleep(self._sample_latency())
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(1 / self.tokens_per_second)
+            usage = self._usage(input_tokens, len(chunks)) if i == len(chunks) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage))
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text, input_tokens = self._respond(messages)
+        chunks = self._chunks(text)
+        await asyncio.sleep(self._sample_latency())
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            usage = self._usage(input_tokens, len(chunks)) if i == len(chunks) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage))
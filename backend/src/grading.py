@@ -0,0 +1,53 @@
+"""
+判题服务模块，在SQL验证外层加入判题结果缓存，供提交接口等调用
+"""
+import logging
+from src import grading_cache, models, validators
+from src.schemas import SQLValidationResult
+
+logger = logging.getLogger(__name__)
+
+# 与运行时状态相关的错误类型，结果不可复用，不写入缓存
+TRANSIENT_ERROR_TYPES = {"runtime_error", "timeout_error", "comparison_error"}
+
+# 错误信息中带有提交SQL片段的错误类型（如数据库报错中的"LINE 1: ..."），结果不在学生之间共享，不写入缓存
+SUBMISSION_SPECIFIC_ERROR_TYPES = {"execution_error"}
+
+
+def question_version(question: models.Question) -> str:
+    """以题目的更新时间作为题目版本"""
+    return question.updated_at.isoformat() if question.updated_at else ""
+
+
+def grade_submission(question: models.Question, schema: models.SampleSchema, student_sql: str, details: bool = True, capture: dict = None) -> SQLValidationResult:
+    """
+    对学生提交的SQL判题，规范化后相同的重复提交直接返回缓存的判题结果
+    参数：
+        question：题目实例
+        schema：题目关联的模式实例
+        student_sql：学生提交的SQL
+        details：结果不一致时是否需要逐行差异
+        capture：见validators.validate_sql，命中判题缓存时不会写入
+    返回：
+        SQLValidationResult：判题结果
+    """
+    version = question_version(question)
+    cached = grading_cache.get_verdict(question.question_id, version, schema.schema_id, student_sql, details)
+    if cached is not None:
+        logger.debug(f"判题缓存命中: question_id={question.question_id}")
+        return cached
+
+    result = validators.validate_sql(
+        student_sql=student_sql,
+        answer_sql=question.answer_sql,
+        schema_definition=schema.schema_definition,
+        schema_name=schema.schema_name,
+        order_sensitive=question.order_sensitive,
+        question_id=question.question_id,
+        schema_id=schema.schema_id,
+        details=details,
+        capture=capture
+    )
+    if result.error_type not in TRANSIENT_ERROR_TYPES | SUBMISSION_SPECIFIC_ERROR_TYPES:
+        grading_cache.set_verdict(question.question_id, version, schema.schema_id, student_sql, result, details)
+    return result
@@ -0,0 +1,191 @@
+"""
+判题缓存模块，缓存参考答案的执行结果和规范化后相同提交的判题结果，避免重复执行SQL
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Optional, Tuple
+from src.config import settings
+from src.schemas import SQLValidationResult
+from src.utils import estimate_size, sql_fingerprint
+
+
+class LRUCache:
+    """线程安全的LRU缓存，同时限制条目数和内存占用"""
+
+    def __init__(self, max_entries: int, max_bytes: int, sizeof: Callable[[Any], int] = estimate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        """命中时返回缓存值并将其移至队尾，未命中返回None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        """写入缓存，超出上限时按最近最少使用顺序淘汰"""
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return          # 单个结果超过总上限，不缓存
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]):
+        """删除所有键满足predicate的条目"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                _, size = self._data.pop(key)
+                self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+@dataclass(frozen=True)
+class ReferenceResult:
+    """参考答案的执行结果"""
+    columns: Tuple[str, ...]                # 结果列名
+    rows: Tuple[tuple, ...]                 # 结果行
+    bytes_read: int = 0                     # 结果占用的内存字节数（估算），用于确定学生SQL的结果预算
+
+
+# 模式版本号，模式更新或删除时递增，使依赖旧版本的缓存失效
+_schema_versions: dict = {}
+_version_lock = threading.Lock()
+
+reference_cache = LRUCache(settings.REFERENCE_CACHE_MAX_ENTRIES, settings.REFERENCE_CACHE_MAX_BYTES)
+verdict_cache = LRUCache(settings.VERDICT_CACHE_MAX_ENTRIES, settings.VERDICT_CACHE_MAX_BYTES)
+plan_cache = LRUCache(settings.PLAN_CACHE_MAX_ENTRIES, max_bytes=float("inf"))
+
+
+def sql_hash(sql: str) -> str:
+    """计算SQL文本的哈希值"""
+    return hashlib.sha256(sql.encode("utf-8")).hexdigest()
+
+
+def schema_version(schema_id: str) -> int:
+    """获取模式当前的版本号"""
+    return _schema_versions.get(schema_id, 0)
+
+
+def _reference_key(question_id: str, schema_id: str, answer_sql: str):
+    return (question_id, sql_hash(answer_sql), schema_id, schema_version(schema_id))
+
+
+def get_reference_result(question_id: str, schema_id: str, answer_sql: str) -> Optional[ReferenceResult]:
+    """
+    读取缓存的参考答案结果
+    参数：
+        question_id：题目id
+        schema_id：模式id
+        answer_sql：参考答案SQL
+    返回：
+        ReferenceResult or None
+    """
+    return reference_cache.get(_reference_key(question_id, schema_id, answer_sql))
+
+
+def set_reference_result(question_id: str, schema_id: str, answer_sql: str, result: ReferenceResult):
+    """写入参考答案结果"""
+    reference_cache.set(_reference_key(question_id, schema_id, answer_sql), result)
+
+
+def get_reference_fingerprint(question_id: str, schema_id: str, answer_sql: str):
+    """读取缓存的参考答案结果指纹"""
+    return reference_cache.get(_reference_key(question_id, schema_id, answer_sql) + ("fingerprint",))
+
+
+def set_reference_fingerprint(question_id: str, schema_id: str, answer_sql: str, fingerprint):
+    """写入参考答案结果指纹"""
+    reference_cache.set(_reference_key(question_id, schema_id, answer_sql) + ("fingerprint",), fingerprint)
+
+
+def _verdict_key(question_id: str, question_version: str, schema_id: str, student_sql: str, details: bool):
+    return (question_id, question_version, schema_id, schema_version(schema_id), sql_fingerprint(student_sql), details)
+
+
+# 缓存的判题结果中代替提交SQL原文的占位符，不同学生的提交规范化后可能相同，但原文（注释、格式）各不相同
+SUBMITTED_SQL = "<submitted_sql>"
+
+
+def _replace_sql(verdict: SQLValidationResult, old: str, new: str) -> SQLValidationResult:
+    """复制判题结果，并将detailed_errors中等于old的sql字段替换为new"""
+    verdict = verdict.model_copy(deep=True)
+    for error in verdict.detailed_errors or []:
+        if isinstance(error, dict) and error.get("sql") == old:
+            error["sql"] = new
+    return verdict
+
+
+def get_verdict(question_id: str, question_version: str, schema_id: str, student_sql: str, details: bool = True) -> Optional[SQLValidationResult]:
+    """
+    读取规范化后相同提交的判题结果
+    参数：
+        question_id：题目id
+        question_version：题目版本（题目的更新时间）
+        schema_id：模式id
+        student_sql：学生提交的SQL
+        details：判题结果是否包含逐行差异
+    返回：
+        SQLValidationResult or None：缓存结果的副本，其中的提交SQL为本次提交的原文
+    """
+    verdict = verdict_cache.get(_verdict_key(question_id, question_version, schema_id, student_sql, details))
+    return _replace_sql(verdict, SUBMITTED_SQL, student_sql) if verdict is not None else None
+
+
+def set_verdict(question_id: str, question_version: str, schema_id: str, student_sql: str, verdict: SQLValidationResult, details: bool = True):
+    """写入判题结果，其中的提交SQL原文替换为占位符"""
+    verdict_cache.set(
+        _verdict_key(question_id, question_version, schema_id, student_sql, details),
+        _replace_sql(verdict, student_sql, SUBMITTED_SQL)
+    )
+
+
+def _plan_key(schema_id: str, sql: str):
+    return (sql_fingerprint(sql), schema_id, schema_version(schema_id))
+
+
+def get_plan(schema_id: str, sql: str):
+    """读取缓存的执行计划摘要"""
+    return plan_cache.get(_plan_key(schema_id, sql))
+
+
+def set_plan(schema_id: str, sql: str, plan):
+    """写入执行计划摘要"""
+    plan_cache.set(_plan_key(schema_id, sql), plan)
+
+
+def invalidate_question(question_id: str):
+    """题目更新后清除该题目的缓存"""
+    reference_cache.invalidate(lambda key: key[0] == question_id)
+    verdict_cache.invalidate(lambda key: key[0] == question_id)
+
+
+def invalidate_schema(schema_id: str):
+    """模式更新或删除后递增版本号并清除依赖该模式的缓存"""
+    with _version_lock:
+        _schema_versions[schema_id] = schema_version(schema_id) + 1
+    reference_cache.invalidate(lambda key: key[2] == schema_id)
+    verdict_cache.invalidate(lambda key: key[2] == schema_id)
+    plan_cache.invalidate(lambda key: key[1] == schema_id)
@@ -0,0 +1,206 @@
+"""
+判题队列模块，使用有界队列和工作线程池异步判题，请求线程只负责入队和查询任务状态
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional
+from src import crud, grading, schemas
+from src.attempt_analysis import analysis_worker
+from src.config import settings
+from src.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """判题队列已满"""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"判题队列已满，请{retry_after}秒后重试")
+
+
+class GradingError(Exception):
+    """判题任务无法完成（如题目不存在）"""
+
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+        super().__init__(detail)
+
+
+@dataclass
+class GradingJob:
+    """一次判题任务"""
+    job_id: str                                         # 任务id
+    user_id: str                                        # 提交用户id
+    question_id: str                                    # 题目id
+    student_sql: str                                    # 提交的sql
+    details: bool                                       # 答案错误时是否需要逐行差异
+    analyze: bool                                       # 是否在后台生成LLM分析
+    submitted_at: datetime                              # 入队时间
+    status: str = "queued"                              # queued / running / done / failed
+    attempt: Optional[schemas.Attempt] = None           # 判题完成后写入的练习记录
+    error: Optional[str] = None                         # 失败原因
+    finished_at: Optional[datetime] = None              # 完成时间
+    future: Future = field(default_factory=Future)      # 完成时设置结果，供等待方使用
+
+    def to_status(self) -> schemas.GradingJobStatus:
+        return schemas.GradingJobStatus(
+            job_id=self.job_id,
+            status=self.status,
+            attempt=self.attempt,
+            error=self.error,
+            submitted_at=self.submitted_at,
+            finished_at=self.finished_at
+        )
+
+
+def grade_and_record(db, user_id: str, question_id: str, student_sql: str, details: bool = True, analyze: bool = False) -> schemas.Attempt:
+    """
+    判题并写入练习记录
+    参数：
+        db：数据库会话
+        user_id：用户id
+        question_id：题目id
+        student_sql：提交的sql
+        details：答案错误时是否需要逐行差异
+        analyze：是否在后台生成LLM分析（复用判题时的查询结果）
+    返回：
+        schemas.Attempt：练习记录
+    """
+    question = crud.get_question(db, question_id)
+    if not question:
+        raise GradingError(404, "题目不存在")
+    schema = crud.get_schema(db, question.schema_id)
+    if not schema:
+        raise GradingError(404, "数据库模式未找到")
+
+    # 规范化后相同的重复提交直接复用判题结果，但仍会记录一次新的练习
+    capture = {} if analyze else None
+    validation_result = grading.grade_submission(question, schema, student_sql, details, capture)
+
+    db_attempt = crud.create_attempt(db, schemas.AttemptCreate(
+        user_id=user_id,
+        question_id=question_id,
+        student_sql=student_sql,
+        is_correct=validation_result.is_correct,
+        error_type=validation_result.error_type,
+        detailed_errors=validation_result.detailed_errors,
+        details=details
+    ))
+    if analyze:
+        crud.create_attempt_analysis(db, db_attempt.attempt_id)
+        analysis_worker.submit(db_attempt.attempt_id, question, schema, student_sql, validation_result, capture)
+    return schemas.Attempt.model_validate(db_attempt)
+
+
+class GradingQueue:
+    """有界判题队列，超过容量时拒绝新任务（背压）"""
+
+    def __init__(self, workers: int, max_pending: int, job_ttl: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grading")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs: Dict[str, GradingJob] = {}
+        self._tasks: Dict[str, Future] = {}        # 未完成任务在执行器中的Future
+        self._lock = threading.Lock()
+        self._job_ttl = job_ttl
+
+    def submit(self, user_id: str, question_id: str, student_sql: str, details: bool = True, analyze: bool = False) -> GradingJob:
+        """
+        提交判题任务
+        返回：
+            GradingJob：新建的任务
+        异常：
+            QueueFull：排队和执行中的任务已达上限
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull(settings.GRADING_RETRY_AFTER)
+        job = GradingJob(
+            job_id=str(uuid.uuid4()),
+            user_id=user_id,
+            question_id=question_id,
+            student_sql=student_sql,
+            details=details,
+            analyze=analyze,
+            submitted_at=datetime.now()
+        )
+        try:
+            task = self._executor.submit(self._run, job)
+        except RuntimeError:
+            self._slots.release()       # 执行器已关闭
+            raise
+        # 提交成功后再登记，避免留下永远不会完成的任务
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+            self._tasks[job.job_id] = task
+        task.add_done_callback(lambda _: self._forget(job.job_id))
+        return job
+
+    def get(self, job_id: str) -> Optional[GradingJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: GradingJob):
+        job.status = "running"
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            job.attempt = grade_and_record(db, job.user_id, job.question_id, job.student_sql, job.details, job.analyze)
+            job.status = "done"
+            job.finished_at = datetime.now()
+        except Exception as e:
+            if not isinstance(e, GradingError):
+                logger.error(f"判题任务失败: {str(e)}", exc_info=True)
+                e = GradingError(500, f"判题失败: {str(e)}")
+            self._fail(job, e)
+        else:
+            job.future.set_result(job.attempt)
+        finally:
+            db.close()
+            self._slots.release()
+            logger.debug(f"判题任务 {job.job_id} 结束，用时 {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    @staticmethod
+    def _fail(job: GradingJob, error: GradingError):
+        """将任务标记为失败，等待方收到GradingError"""
+        job.error = error.detail
+        job.status = "failed"
+        job.finished_at = datetime.now()
+        job.future.set_exception(error)
+
+    def _forget(self, job_id: str):
+        with self._lock:
+            self._tasks.pop(job_id, None)
+
+    def _prune(self):
+        """清理超过保留时间的已完成任务（调用方需持有锁）"""
+        now = datetime.now()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at and (now - job.finished_at).total_seconds() > self._job_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        """停止接收任务，排队中的任务取消并标记为失败（执行中的任务继续完成）"""
+        with self._lock:
+            tasks = list(self._tasks.items())
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for job_id, task in tasks:
+            if task.cancelled():
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                if job is not None:
+                    self._fail(job, GradingError(503, "服务关闭，判题未完成"))
+                    self._slots.release()
+
+
+grading_queue = GradingQueue(settings.GRADING_WORKERS, settings.GRADING_QUEUE_MAX_PENDING, settings.GRADING_JOB_TTL)
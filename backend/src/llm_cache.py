@@ -0,0 +1,133 @@
+"""
+LLM分析结果缓存模块，相同题目下原文相同的提交直接复用分析结果，支持进程内和Redis两种后端
+"""
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+from src.config import settings
+from src.grading_cache import sql_hash
+from src.llm_metrics import llm_metrics
+from src.llm_utils import ANALYSIS_FAILED
+
+logger = logging.getLogger(__name__)
+
+
+def analysis_cache_key(question_id: str, answer_sql: str, student_sql: str, is_correct: bool) -> str:
+    """
+    构造分析缓存键
+    参数：
+        question_id：题目id
+        answer_sql：参考答案SQL
+        student_sql：学生提交的SQL（按原文计算：提示中包含原文及其注释，分析结果可能引用它们，不能在不同原文之间共享）
+        is_correct：判题结果
+    返回：
+        str：缓存键
+    """
+    raw = json.dumps([question_id, sql_hash(answer_sql), sql_hash(student_sql), bool(is_correct)], ensure_ascii=False)
+    return sql_hash(raw)
+
+
+class AnalysisCache(ABC):
+    """分析缓存后端基类，命中情况记录到LLM调用指标"""
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self._get(key)
+        llm_metrics.record_cache("analysis", value is not None)
+        return value
+
+    def set(self, key: str, value: dict):
+        self._set(key, value)
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[dict]:
+        """读取缓存，未命中或出错时返回None"""
+
+    @abstractmethod
+    def _set(self, key: str, value: dict):
+        """写入缓存"""
+
+
+class NullAnalysisCache(AnalysisCache):
+    """不缓存"""
+
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value):
+        pass
+
+
+class MemoryAnalysisCache(AnalysisCache):
+    """进程内缓存，按TTL过期并按最近最少使用淘汰"""
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return dict(value)
+
+    def _set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, dict(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class RedisAnalysisCache(AnalysisCache):
+    """Redis缓存，多个进程共享；Redis不可用时视为未命中"""
+
+    def __init__(self, url: str, ttl: int, prefix: str = "sql-analysis:"):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"读取分析缓存失败: {str(e)}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def _set(self, key, value):
+        try:
+            self.client.setex(self.prefix + key, self.ttl, json.dumps(value, ensure_ascii=False))
+        except Exception as e:
+            logger.warning(f"写入分析缓存失败: {str(e)}")
+
+
+def store_analysis(key: str, analysis: dict):
+    """缓存分析结果，LLM调用失败时的占位结果不缓存"""
+    if analysis.get("correctness_analysis") != ANALYSIS_FAILED:
+        analysis_cache.set(key, analysis)
+
+
+def create_analysis_cache() -> AnalysisCache:
+    """根据配置创建缓存后端"""
+    backend = settings.LLM_CACHE_BACKEND.lower()
+    if backend == "redis":
+        return RedisAnalysisCache(settings.REDIS_URL, settings.LLM_CACHE_TTL)
+    if backend == "memory":
+        return MemoryAnalysisCache(settings.LLM_CACHE_TTL, settings.LLM_CACHE_MAX_ENTRIES)
+    return NullAnalysisCache()
+
+
+analysis_cache = create_analysis_cache()
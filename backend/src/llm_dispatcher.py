@@ -0,0 +1,231 @@
+"""
+LLM调用调度模块，限制同时进行的LLM调用数，超出部分按优先级排队，队列满时快速拒绝
+同步调用方（线程池中的路由）和异步调用方（流式分析）共用同一组名额
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import Optional
+from src.config import settings
+
+
+class Priority(IntEnum):
+    """调用优先级，数值越小越先获得名额"""
+    INTERACTIVE = 0                                     # 学生交互式分析
+    BATCH = 1                                           # 教师生成题目
+
+
+class LLMUnavailable(Exception):
+    """LLM调用未能开始"""
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class LLMBusy(LLMUnavailable):
+    """等待队列已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"AI服务繁忙，请{retry_after}秒后重试", retry_after)
+
+
+class LLMDeadlineExceeded(LLMUnavailable):
+    """在截止时间前未获得调用名额"""
+    status_code = 504
+
+    def __init__(self, retry_after: int):
+        super().__init__("等待AI服务超时，请稍后重试", retry_after)
+
+
+class _Waiter:
+    """排队中的一次调用，获得名额时通过wake通知"""
+    __slots__ = ("priority", "seq", "wake", "granted", "cancelled")
+
+    def __init__(self, priority: int, seq: int, wake):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMDispatcher:
+    """
+    全局LLM调用名额
+    参数：
+        max_in_flight：同时进行的调用数上限
+        max_waiting：等待队列长度上限，超出时抛出LLMBusy
+        retry_after：建议客户端重试的间隔（秒）
+    """
+
+    def __init__(self, max_in_flight: int, max_waiting: int, retry_after: int):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._waiting = 0
+        # 统计信息
+        self._acquired = {p: 0 for p in Priority}
+        self._rejected = {p: 0 for p in Priority}
+        self._expired = {p: 0 for p in Priority}
+        self._wait_total = {p: 0.0 for p in Priority}
+        self._wait_max = {p: 0.0 for p in Priority}
+
+    def _try_acquire(self, priority: Priority, wake) -> Optional[_Waiter]:
+        """有空闲名额时直接占用并返回None，否则加入等待队列，队列已满时抛出LLMBusy"""
+        with self._lock:
+            if self._in_flight < self.max_in_flight and self._waiting == 0:
+                self._in_flight += 1
+                self._record(priority, 0.0)
+                return None
+            if self._waiting >= self.max_waiting:
+                self._rejected[priority] += 1
+                raise LLMBusy(self.retry_after)
+            waiter = _Waiter(priority, next(self._seq), wake)
+            heapq.heappush(self._heap, waiter)
+            self._waiting += 1
+            return waiter
+
+    def _finish_wait(self, waiter: _Waiter, started: float) -> bool:
+        """等待结束时调用，已获得名额返回True，否则从队列中撤销"""
+        with self._lock:
+            if waiter.granted:
+                self._record(waiter.priority, time.monotonic() - started)
+                return True
+            waiter.cancelled = True
+            self._waiting -= 1
+            self._expired[waiter.priority] += 1
+            return False
+
+    def _record(self, priority: Priority, waited: float):
+        self._acquired[priority] += 1
+        self._wait_total[priority] += waited
+        self._wait_max[priority] = max(self._wait_max[priority], waited)
+
+    def release(self):
+        """归还名额，优先交给等待队列中优先级最高的调用"""
+        with self._lock:
+            while self._heap:
+                waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._waiting -= 1
+                waiter.wake()
+                return
+            self._in_flight -= 1
+
+    def acquire(self, priority: Priority, timeout: float) -> float:
+        """
+        同步获取名额，在timeout秒内未获得时抛出LLMDeadlineExceeded
+        返回：
+            float：排队等待的秒数
+        """
+        event = threading.Event()
+        started = time.monotonic()
+        waiter = self._try_acquire(priority, event.set)
+        if waiter is None:
+            return 0.0
+        event.wait(timeout)
+        if not self._finish_wait(waiter, started):
+            raise LLMDeadlineExceeded(self.retry_after)
+        return time.monotonic() - started
+
+    async def acquire_async(self, priority: Priority, timeout: float) -> float:
+        """
+        异步获取名额，等待期间不占用线程
+        返回：
+            float：排队等待的秒数
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        started = time.monotonic()
+        waiter = self._try_acquire(priority, wake)
+        if waiter is None:
+            return 0.0
+        try:
+            await asyncio.wait({granted}, timeout=timeout)
+        except asyncio.CancelledError:
+            # 被取消（如客户端断开）时撤销排队或归还已获得的名额
+            if self._finish_wait(waiter, started):
+                self.release()
+            raise
+        if not self._finish_wait(waiter, started):
+            raise LLMDeadlineExceeded(self.retry_after)
+        return time.monotonic() - started
+
+    @contextmanager
+    def slot(self, priority: Priority, timeout: float):
+        """同步占用一个名额，退出时归还，返回排队等待的秒数"""
+        waited = self.acquire(priority, timeout)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: Priority, timeout: float):
+        """异步占用一个名额，退出时归还，返回排队等待的秒数"""
+        waited = await self.acquire_async(priority, timeout)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def is_saturated(self) -> bool:
+        """等待队列是否已满（用于在开始流式响应前快速拒绝）"""
+        with self._lock:
+            return self._waiting >= self.max_waiting
+
+    def stats(self) -> dict:
+        """当前排队情况及各优先级的等待时间统计"""
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "max_waiting": self.max_waiting,
+                "in_flight": self._in_flight,
+                "queue_depth": self._waiting,
+                "priorities": {
+                    p.name.lower(): {
+                        "acquired": self._acquired[p],
+                        "rejected": self._rejected[p],
+                        "deadline_exceeded": self._expired[p],
+                        "avg_wait_seconds": self._wait_total[p] / self._acquired[p] if self._acquired[p] else 0.0,
+                        "max_wait_seconds": self._wait_max[p],
+                    }
+                    for p in Priority
+                },
+            }
+
+
+class Deadline:
+    """一次调用的截止时间，排队和LLM请求共用"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+
+llm_dispatcher = LLMDispatcher(
+    settings.LLM_MAX_IN_FLIGHT,
+    settings.LLM_MAX_WAITING,
+    settings.LLM_RETRY_AFTER
+)
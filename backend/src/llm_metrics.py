@@ -0,0 +1,178 @@
+"""
+LLM调用指标模块，记录每次调用的排队时间、首token时间、总耗时、token用量和失败类型，
+每次调用输出一条结构化日志，并汇总供指标接口查询
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Optional
+import httpx
+import openai
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.exceptions import OutputParserException
+from src.llm_dispatcher import LLMUnavailable
+
+logger = logging.getLogger("llm.metrics")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# 每种调用保留的最近记录数，用于计算分位数
+WINDOW_SIZE = 1000
+
+
+@dataclass
+class CallRecord:
+    """一次LLM调用的记录"""
+    kind: str                                       # 调用类型：question / analysis / analysis_stream
+    priority: str                                   # 调度优先级
+    outcome: str = "ok"                             # ok / parse_error / transport_error / timeout / rejected / cancelled
+    model: Optional[str] = None                     # 模型名称
+    queue_wait_ms: Optional[float] = None           # 等待调用名额的时间
+    ttft_ms: Optional[float] = None                 # 首token时间（仅流式调用）
+    latency_ms: Optional[float] = None              # 从获得名额到调用结束的时间
+    prompt_tokens: Optional[int] = None             # 提示token数（接口未返回用量时为估算值）
+    completion_tokens: Optional[int] = None         # 生成token数
+    reasoning_tokens: Optional[int] = None          # 其中推理模型的思考token数
+    error: Optional[str] = None                     # 失败信息
+
+
+def classify_error(exc: BaseException) -> str:
+    """区分解析失败、超时、排队失败和传输失败"""
+    if isinstance(exc, LLMUnavailable):
+        return "rejected"
+    if isinstance(exc, (OutputParserException, json.JSONDecodeError)):
+        return "parse_error"
+    if isinstance(exc, (openai.APITimeoutError, httpx.TimeoutException, TimeoutError)):
+        return "timeout"
+    if isinstance(exc, (GeneratorExit, asyncio.CancelledError)):
+        return "cancelled"
+    return "transport_error"
+
+
+class CallTracker(BaseCallbackHandler):
+    """作为langchain回调挂到一次调用上，收集首token时间和token用量"""
+
+    def __init__(self, kind: str, priority: str, model: str = None):
+        self.record = CallRecord(kind=kind, priority=priority, model=model)
+        self._started = time.perf_counter()
+        self._llm_started = None
+
+    def queued(self, waited: float):
+        """获得调用名额，waited为排队秒数"""
+        self.record.queue_wait_ms = waited * 1000
+        self._llm_started = time.perf_counter()
+
+    def estimated_prompt_tokens(self, tokens: int):
+        if self.record.prompt_tokens is None:
+            self.record.prompt_tokens = tokens
+
+    def failed(self, exc: BaseException):
+        self.record.outcome = classify_error(exc)
+        self.record.error = str(exc)[:200]
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        if self.record.ttft_ms is None and self._llm_started is not None:
+            self.record.ttft_ms = (time.perf_counter() - self._llm_started) * 1000
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    self.record.prompt_tokens = usage.get("input_tokens")
+                    self.record.completion_tokens = usage.get("output_tokens")
+                    self.record.reasoning_tokens = (usage.get("output_token_details") or {}).get("reasoning")
+                    return
+
+    def finish(self):
+        start = self._llm_started if self._llm_started is not None else self._started
+        self.record.latency_ms = (time.perf_counter() - start) * 1000
+
+
+def _percentiles(values) -> dict:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    return {
+        "p50": values[len(values) // 2],
+        "p95": values[min(int(len(values) * 0.95), len(values) - 1)],
+        "max": values[-1],
+    }
+
+
+class LLMMetrics:
+    """汇总LLM调用记录和各类缓存的命中情况"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._outcomes = {}
+        self._tokens = {}
+        self._cache = {}
+
+    @contextmanager
+    def track(self, kind: str, priority: str, model: str = None):
+        """
+        跟踪一次调用，退出时记录指标并输出日志
+        返回：
+            CallTracker：需作为回调传给调用链，并在获得名额时调用queued
+        """
+        tracker = CallTracker(kind, priority, model)
+        try:
+            yield tracker
+        except BaseException as e:
+            tracker.failed(e)
+            raise
+        finally:
+            tracker.finish()
+            self.record(tracker.record)
+
+    def record(self, record: CallRecord):
+        with self._lock:
+            self._windows.setdefault(record.kind, deque(maxlen=WINDOW_SIZE)).append(record)
+            self._outcomes.setdefault(record.kind, Counter())[record.outcome] += 1
+            tokens = self._tokens.setdefault(record.kind, Counter())
+            tokens["prompt"] += record.prompt_tokens or 0
+            tokens["completion"] += record.completion_tokens or 0
+            tokens["reasoning"] += record.reasoning_tokens or 0
+        logger.info(json.dumps({"event": "llm_call", **asdict(record)}, ensure_ascii=False))
+
+    def record_cache(self, kind: str, hit: bool):
+        """记录一次缓存查询，按缓存类型（如analysis）分别统计"""
+        with self._lock:
+            self._cache.setdefault(kind, Counter())[hit] += 1
+        logger.info(json.dumps({"event": "llm_cache", "kind": kind, "hit": hit}))
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = {}
+            for kind, window in self._windows.items():
+                calls[kind] = {
+                    "count": sum(self._outcomes[kind].values()),
+                    "outcomes": dict(self._outcomes[kind]),
+                    "tokens": dict(self._tokens[kind]),
+                    "queue_wait_ms": _percentiles(r.queue_wait_ms for r in window),
+                    "ttft_ms": _percentiles(r.ttft_ms for r in window),
+                    "latency_ms": _percentiles(r.latency_ms for r in window if r.outcome == "ok"),
+                }
+            cache = {}
+            for kind, counter in self._cache.items():
+                lookups = counter[True] + counter[False]
+                cache[kind] = {
+                    "hits": counter[True],
+                    "misses": counter[False],
+                    "hit_rate": counter[True] / lookups if lookups else 0.0,
+                }
+            return {"calls": calls, "cache": cache}
+
+
+llm_metrics = LLMMetrics()
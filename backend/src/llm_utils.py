@@ -2,6 +2,13 @@ from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from pydantic import BaseModel, Field
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.language_models.chat_models import BaseChatModel
+from src.config import settings
+from src.llm_dispatcher import llm_dispatcher, Priority, Deadline
+from src.prompt_compaction import estimate_tokens, prompt_stats
+from src.llm_metrics import llm_metrics
+import asyncio
+import httpx
 import logging
 
 # 定义结构化输出模型
@@ -18,33 +25,13 @@ class SQLAnalysisOutput(BaseModel):
     optimization_suggestions: str = Field(description="优化建议")
     thinking_difference: str = Field(description="与标准答案的思路异同")
 
-class LLMHelper:
-    def __init__(self, api_key, base_url):
-        self.llm = ChatOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            model="deepseek-reasoner",
-            temperature=0.5
-        )
-        self.output_parser = JsonOutputParser(pydantic_object=QuestionOutput)
-        self.logger = logging.getLogger("LLMHelper")
-        if not self.logger.handlers:
-            handler = logging.StreamHandler()
-            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
-            self.logger.setLevel(logging.DEBUG)
 
+# LLM调用失败时返回的占位内容
+ANALYSIS_FAILED = "分析失败"
 
-    def generate_question(self, schema_definition: str, knowledge_points: list) -> dict:
-        # 记录输入参数
-        self.logger.debug("开始题目生成流程")
-        self.logger.info(f"知识点列表: {', '.join(knowledge_points)}")
-        self.logger.debug(f"数据库模式定义: {schema_definition[:100]}...")  # 显示前100字符
 
-        # 构建多知识点prompt
-        points_str = "、".join(knowledge_points)
-        prompt_template = """
+# 题目生成提示模板
+QUESTION_PROMPT_TEMPLATE = """
         基于以下数据库模式:
         {schema}
 
@@ -79,57 +66,8 @@ class LLMHelper:
         - [ ] 所有字段是否100%完整（无空值）
         """
 
-        # 记录生成的prompt
-        self.logger.debug("生成完整提示模板:")
-        self.logger.debug(prompt_template)
-
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=["schema", "points"],
-            partial_variables={
-                "format_instructions": self.output_parser.get_format_instructions()  # 添加格式指令
-            }
-        )
-
-        chain = prompt | self.llm | self.output_parser
-
-        # 调用前记录
-        self.logger.info("调用LLM生成题目内容...")
-
-        try:
-            result = chain.invoke({
-                "schema": schema_definition,
-                "points": points_str
-            })
-
-            result['question_title'] = result.get('question_title') or "未命名题目"
-            result['description'] = result.get('description') or "题目描述生成失败"
-            result['answer_sql'] = result.get('answer_sql') or ""
-
-            self.logger.debug(f"生成题目标题: {result['question_title']}")
-            self.logger.debug(f"生成题目描述: {result['description'][:50]}...")
-            self.logger.debug(f"生成SQL语句: {result['answer_sql'][:50]}...")
-
-            return result
-        except Exception as e:
-            # 添加错误处理
-            self.logger.error(f"LLM调用失败: {str(e)}", exc_info=True)
-            return {
-                "question_title": "生成失败",
-                "description": "题目生成失败，请重试",
-                "answer_sql": ""
-            }
-    
-    def analyze_sql(self, question_description, schema_definition, student_sql, answer_sql, student_result, answer_result, is_correct):
-        """
-        将用户输入和标准答案交予LLM分析（未附上执行结果）
-        参数：
-            question_description：问题描述
-            schema_definition：模式定义
-            student_sql：用户提交的sql
-            answer_sql：标准答案
-        """
-        prompt_template = """
+# SQL分析提示模板
+ANALYSIS_PROMPT_TEMPLATE = """
             你是一位专业的SQL导师，请对学生的SQL答案进行详细分析。要求包括以下部分：
 
             1. 正确性分析：
@@ -171,31 +109,273 @@ class LLMHelper:
             安全性要求：
             如果结果为False，请不要再分析中透露标准答案SQL的细节，仅仅做提示启发即可。
             """
-        prompt = PromptTemplate(
-            template=prompt_template,
+
+
+class LLMHelper:
+    """
+    LLM调用封装，应用启动时创建一次并在所有请求间共享：
+    HTTP客户端使用连接池保持长连接，提示模板、解析器和调用链在初始化时构建
+    """
+
+    def __init__(
+            self,
+            api_key,
+            base_url,
+            model: str = "deepseek-reasoner",
+            temperature: float = 0.5,
+            timeout: float = 120,
+            max_connections: int = 50,
+            max_keepalive_connections: int = 20,
+            keepalive_expiry: float = 60,
+            llm: BaseChatModel = None
+    ):
+        """
+        参数：
+            llm：使用的聊天模型，为空时按api_key和base_url创建ChatOpenAI（见create_chat_model）
+        """
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http_client = httpx.Client(limits=limits, timeout=timeout)
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        self.llm = llm or ChatOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            model=model,
+            temperature=temperature,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+            stream_usage=True                           # 流式调用时也返回token用量
+        )
+        self.model_name = getattr(self.llm, "model_name", None) or self.llm._llm_type
+        self.output_parser = JsonOutputParser(pydantic_object=QuestionOutput)
+        self.analyze_parser = JsonOutputParser(pydantic_object=SQLAnalysisOutput)
+
+        self.question_prompt = PromptTemplate(
+            template=QUESTION_PROMPT_TEMPLATE,
+            input_variables=["schema", "points"],
+            partial_variables={
+                "format_instructions": self.output_parser.get_format_instructions()  # 添加格式指令
+            }
+        )
+        self.analysis_prompt = PromptTemplate(
+            template=ANALYSIS_PROMPT_TEMPLATE,
             input_variables=["question_description", "schema_definition", "student_sql", "answer_sql", "student_result", "answer_result", "is_correct"]
         )
+        # 同步调用的链在每次调用时按剩余截止时间构建（见_bounded），流式分析由asyncio.timeout限制总时长
+        self.analysis_chain = self.analysis_prompt | self.llm | self.analyze_parser
+
+        self.logger = logging.getLogger("LLMHelper")
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.DEBUG)
+
+    def close(self):
+        """关闭同步HTTP客户端"""
+        self.http_client.close()
+
+    async def aclose(self):
+        """关闭同步和异步HTTP客户端"""
+        self.http_client.close()
+        await self.http_async_client.aclose()
+
+    def _measure(self, kind: str, prompt, inputs: dict) -> int:
+        """记录实际发送的提示大小，返回估算的token数"""
+        text = prompt.format(**inputs)
+        tokens = estimate_tokens(text)
+        prompt_stats.record(kind, len(text), tokens)
+        self.logger.info(f"{kind}提示长度: {len(text)}字符，约{tokens} tokens")
+        return tokens
+
+    def _bounded(self, prompt, parser, deadline: Deadline):
+        """构建单次请求超时不超过剩余截止时间的调用链"""
+        return prompt | self.llm.bind(timeout=max(deadline.remaining(), 1)) | parser
+
+    def generate_question(self, schema_definition: str, knowledge_points: list, priority: Priority = Priority.BATCH) -> dict:
+        # 记录输入参数
+        self.logger.debug("开始题目生成流程")
+        self.logger.info(f"知识点列表: {', '.join(knowledge_points)}")
+        self.logger.debug(f"数据库模式定义: {schema_definition[:100]}...")  # 显示前100字符
+
+        # 构建多知识点prompt
+        points_str = "、".join(knowledge_points)
+
+        # 记录生成的prompt
+        self.logger.debug("生成完整提示模板:")
+        self.logger.debug(QUESTION_PROMPT_TEMPLATE)
+
+        # 调用前记录
+        self.logger.info("调用LLM生成题目内容...")
+
+        inputs = {
+            "schema": schema_definition,
+            "points": points_str
+        }
+        prompt_tokens = self._measure("question", self.question_prompt, inputs)
+
+        # 排队获取调用名额，队列已满或截止前未获得名额时抛出LLMUnavailable
+        deadline = Deadline(settings.LLM_GENERATION_DEADLINE)
+        with llm_metrics.track("question", priority.name.lower(), self.model_name) as call, \
+                llm_dispatcher.slot(priority, deadline.remaining()) as waited:
+            call.queued(waited)
+            call.estimated_prompt_tokens(prompt_tokens)
+            try:
+                result = self._bounded(self.question_prompt, self.output_parser, deadline).invoke(
+                    inputs, config={"callbacks": [call]}
+                )
+
+                result['question_title'] = result.get('question_title') or "未命名题目"
+                result['description'] = result.get('description') or "题目描述生成失败"
+                result['answer_sql'] = result.get('answer_sql') or ""
+
+                self.logger.debug(f"生成题目标题: {result['question_title']}")
+                self.logger.debug(f"生成题目描述: {result['description'][:50]}...")
+                self.logger.debug(f"生成SQL语句: {result['answer_sql'][:50]}...")
+
+                return result
+            except Exception as e:
+                # 添加错误处理
+                call.failed(e)
+                self.logger.error(f"LLM调用失败: {str(e)}", exc_info=True)
+                return {
+                    "question_title": "生成失败",
+                    "description": "题目生成失败，请重试",
+                    "answer_sql": ""
+                }
+    
+    def analyze_sql(self, question_description, schema_definition, student_sql, answer_sql, student_result, answer_result, is_correct):
+        """
+        将用户输入和标准答案交予LLM分析（未附上执行结果）
+        参数：
+            question_description：问题描述
+            schema_definition：模式定义
+            student_sql：用户提交的sql
+            answer_sql：标准答案
+        """
+        inputs = {
+            "question_description": question_description,
+            "schema_definition": schema_definition,
+            "student_sql": student_sql,
+            "answer_sql": answer_sql,
+            "student_result": student_result,
+            "answer_result": answer_result,
+            "is_correct": str(is_correct)
+        }
+        prompt_tokens = self._measure("analysis", self.analysis_prompt, inputs)
+
+        deadline = Deadline(settings.LLM_ANALYSIS_DEADLINE)
+        with llm_metrics.track("analysis", Priority.INTERACTIVE.name.lower(), self.model_name) as call, \
+                llm_dispatcher.slot(Priority.INTERACTIVE, deadline.remaining()) as waited:
+            call.queued(waited)
+            call.estimated_prompt_tokens(prompt_tokens)
+            try:
+                result = self._bounded(self.analysis_prompt, self.analyze_parser, deadline).invoke(
+                    inputs, config={"callbacks": [call]}
+                )
+                return result
+            except Exception as e:
+                call.failed(e)
+                self.logger.error(f"LLM分析失败: {str(e)}")
+                return analysis_failed_result()
+
+    async def astream_analysis(self, question_description, schema_definition, student_sql, answer_sql, student_result, answer_result, is_correct):
+        """
+        流式分析，参数同analyze_sql
+        返回：
+            异步迭代器，每次产出到目前为止解析出的部分结果（dict，字段内容逐步变长）
+        """
+        inputs = {
+            "question_description": question_description,
+            "schema_definition": schema_definition,
+            "student_sql": student_sql,
+            "answer_sql": answer_sql,
+            "student_result": student_result,
+            "answer_result": answer_result,
+            "is_correct": str(is_correct)
+        }
+        prompt_tokens = self._measure("analysis", self.analysis_prompt, inputs)
+
+        deadline = Deadline(settings.LLM_ANALYSIS_DEADLINE)
+        with llm_metrics.track("analysis_stream", Priority.INTERACTIVE.name.lower(), self.model_name) as call:
+            async with llm_dispatcher.aslot(Priority.INTERACTIVE, deadline.remaining()) as waited:
+                call.queued(waited)
+                call.estimated_prompt_tokens(prompt_tokens)
+                async with asyncio.timeout(deadline.remaining()):
+                    async for partial in self.analysis_chain.astream(inputs, config={"callbacks": [call]}):
+                        if isinstance(partial, dict):
+                            yield partial
+
+
+def analysis_failed_result() -> dict:
+    """LLM分析失败时返回的占位结果"""
+    return {
+        "correctness_analysis": ANALYSIS_FAILED,
+        "optimization_suggestions": ANALYSIS_FAILED,
+        "thinking_difference": ANALYSIS_FAILED,
+        "learning_analysis": ANALYSIS_FAILED
+    }
+
+
+# 应用级共享的LLMHelper实例，在应用启动时创建
+_llm_helper: LLMHelper = None
+
+
+def create_chat_model() -> BaseChatModel:
+    """
+    按settings.LLM_BACKEND选择模型后端：
+        "openai"：返回None，由LLMHelper创建ChatOpenAI
+        "fake"：本地模拟模型，用于无网络压测
+    """
+    backend = settings.LLM_BACKEND.lower()
+    if backend == "fake":
+        from src.fake_llm import FakeChatModel
+        return FakeChatModel(
+            latency_mean=settings.FAKE_LLM_LATENCY_MEAN,
+            latency_stddev=settings.FAKE_LLM_LATENCY_STDDEV,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            seed=settings.FAKE_LLM_SEED
+        )
+    if backend != "openai":
+        raise ValueError(f"未知的LLM后端: {settings.LLM_BACKEND}")
+    return None
+
+
+def create_llm_helper() -> LLMHelper:
+    """根据配置创建LLMHelper"""
+    return LLMHelper(
+        settings.OPENAI_API_KEY,
+        settings.MODEL_BASE_URL,
+        model=settings.LLM_MODEL,
+        temperature=settings.LLM_TEMPERATURE,
+        timeout=settings.LLM_TIMEOUT,
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        llm=create_chat_model()
+    )
+
+
+def init_llm_helper() -> LLMHelper:
+    """应用启动时创建共享实例"""
+    global _llm_helper
+    if _llm_helper is None:
+        _llm_helper = create_llm_helper()
+    return _llm_helper
+
+
+def get_llm_helper() -> LLMHelper:
+    """获取共享的LLMHelper（依赖项），未初始化时按需创建"""
+    return _llm_helper or init_llm_helper()
+
 
-        analyze_parser = JsonOutputParser(pydantic_object=SQLAnalysisOutput)
-
-        chain = prompt | self.llm | analyze_parser
-
-        try:
-            result = chain.invoke({
-                "question_description": question_description,
-                "schema_definition": schema_definition,
-                "student_sql": student_sql,
-                "answer_sql": answer_sql,
-                "student_result": student_result,
-                "answer_result": answer_result,
-                "is_correct": str(is_correct)
-            })
-            return result
-        except Exception as e:
-            self.logger.error(f"LLM分析失败: {str(e)}")
-            return {
-                "correctness_analysis": "分析失败",
-                "optimization_suggestions": "分析失败",
-                "thinking_difference": "分析失败",
-                "learning_analysis": "分析失败"
-            }
\ No newline at end of file
+async def close_llm_helper():
+    """应用关闭时释放HTTP连接"""
+    global _llm_helper
+    if _llm_helper is not None:
+        await _llm_helper.aclose()
+        _llm_helper = None
@@ -1,18 +1,48 @@
 """
 FastAPI应用入口，初始化FastAPI应用并注册路由
 """
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from src.routers import users, questions, attempts, analyze, schemas as schema_router
-from src.database import engine, Base
+from fastapi.responses import JSONResponse
+from src.routers import users, questions, attempts, analyze, metrics, schemas as schema_router
+from src.database import engine, Base, schema_pools
+from src.grading_queue import grading_queue
+from src import regrade, llm_utils
+from src.attempt_analysis import analysis_worker
+from src.llm_dispatcher import LLMUnavailable
 
 
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时创建共享的LLM客户端，并清理上次退出时遗留的未完成分析
+    llm_utils.init_llm_helper()
+    analysis_worker.recover()
+    yield
+    await llm_utils.close_llm_helper()
+    # 关闭时停止判题、分析和重新判题的工作线程，并释放判题连接池
+    grading_queue.shutdown()
+    analysis_worker.shutdown()
+    regrade.shutdown()
+    schema_pools.dispose_all()
+
+
 # 初始化FastAPI应用
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+# LLM调用排队失败时返回503/504，并提示客户端重试间隔
+@app.exception_handler(LLMUnavailable)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailable):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 
 origins = [
@@ -34,6 +64,7 @@ app.include_router(questions.router, prefix="/questions")
 app.include_router(attempts.router, prefix="/attempts")
 app.include_router(schema_router.router, prefix="/sample-schemas")
 app.include_router(analyze.router, prefix="/analyze")
+app.include_router(metrics.router, prefix="/metrics")
 
 
 # 跟路由
@@ -1,7 +1,7 @@
 """
-数据库的四个表的定义
+数据库表的定义
 """
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, String, Text
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, String, Text, false, true
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
 from src.database import Base
@@ -60,6 +60,27 @@ class Attempt(Base):
     error_type = Column(String)                                             # 错误类型
     submitted_at = Column(DateTime)                                         # 提交日期
     detailed_errors = Column(JSONB)                                         # 详细错误信息
+    details = Column(Boolean, default=True, server_default=true())          # 提交时是否要求逐行差异（重新判题时沿用）
 
     user = relationship("User")                                             # 关联User
-    question = relationship("Question")                                     # 关联Question
\ No newline at end of file
+    question = relationship("Question")                                     # 关联Question
+
+    # 已有数据库需执行migrations中的脚本补建details列和这些索引（create_all不会修改已存在的表）
+    __table_args__ = (
+        # 练习历史：按用户过滤并按提交时间排序
+        Index("ix_attempts_user_id_submitted_at", "user_id", "submitted_at"),
+        # 按题目和用户（及对错）查询练习记录，也用于按题目重新判题
+        Index("ix_attempts_question_user_correct_submitted", "question_id", "user_id", "is_correct", "submitted_at"),
+        # 错题查询：只索引错误的练习
+        Index("ix_attempts_incorrect_user_question", "user_id", "question_id", postgresql_where=(is_correct == false())),
+    )
+
+class AttemptAnalysis(Base):
+    __tablename__ = "attempt_analyses"
+
+    attempt_id = Column(String, ForeignKey("attempts.attempt_id", ondelete="CASCADE"), primary_key=True)     # 练习id（主码）
+    status = Column(String)                                                 # 分析状态："pending" / "done" / "failed"
+    analysis = Column(JSONB)                                                # LLM分析结果
+    error = Column(Text)                                                    # 失败原因
+    created_at = Column(DateTime)                                           # 创建时间
+    finished_at = Column(DateTime)                                          # 完成时间
@@ -0,0 +1,180 @@
+"""
+提示压缩模块，将模式定义渲染为紧凑的DDL形式，对查询结果做首尾采样，使提示的可变部分控制在token预算内
+"""
+import json
+import threading
+from typing import List, Optional, Sequence
+from src.utils import convert_result_to_str
+
+# 采样档位：(结果首部行数, 结果尾部行数, 每个表的示例数据行数)，超出预算时逐档降低
+SAMPLING_LEVELS = ((10, 5, 3), (5, 2, 2), (3, 1, 1), (1, 0, 0), (0, 0, 0))
+
+# 单个值在提示中保留的最大字符数
+MAX_CELL_CHARS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数：中日韩字符按每字1个token，其余按每4个字符1个token
+    参数：
+        text：文本
+    返回：
+        int：估算的token数
+    """
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _format_value(value) -> str:
+    """将值格式化为SQL字面量形式，过长时截断"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float, bool)):
+        return str(value)
+    text = str(value)
+    if len(text) > MAX_CELL_CHARS:
+        text = text[:MAX_CELL_CHARS] + "…"
+    return "'" + text.replace("'", "''") + "'"
+
+
+def render_schema(schema_definition, sample_rows: int = 3) -> str:
+    """
+    将模式定义渲染为紧凑的DDL
+    参数：
+        schema_definition：模式定义，格式为{"tables": [{"name", "columns": [{"name", "type", "primary"}], "sample_data"}]}
+        sample_rows：每个表附带的示例数据行数
+    返回：
+        str：CREATE TABLE语句及示例数据注释；无法识别的格式退化为紧凑JSON
+    """
+    tables = schema_definition.get("tables") if isinstance(schema_definition, dict) else None
+    if not isinstance(tables, list):
+        return json.dumps(schema_definition, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    lines = []
+    for table in tables:
+        columns = table.get("columns", [])
+        column_defs = []
+        for column in columns:
+            column_def = f"{column['name']} {column.get('type', '')}".rstrip()
+            if column.get("primary"):
+                column_def += " PRIMARY KEY"
+            column_defs.append(column_def)
+        lines.append(f"CREATE TABLE {table['name']} ({', '.join(column_defs)});")
+
+        sample_data = table.get("sample_data") or []
+        if sample_rows > 0 and sample_data:
+            names = [column["name"] for column in columns]
+            shown = sample_data[:sample_rows]
+            values = ", ".join(
+                "(" + ", ".join(_format_value(row.get(name)) for name in names) + ")"
+                for row in shown
+            )
+            lines.append(f"-- 示例数据（{len(shown)}/{len(sample_data)}行）: {values}")
+    return "\n".join(lines)
+
+
+def render_result(rows: Sequence, columns: Optional[List[str]], head: int, tail: int, truncated: bool = False) -> str:
+    """
+    首尾采样渲染查询结果，并注明总行数和省略的行数
+    参数：
+        rows：结果行
+        columns：列名
+        head：保留的首部行数
+        tail：保留的尾部行数
+        truncated：结果是否已在读取时被截断（此时总行数为下限）
+    返回：
+        str：结果字符串
+    """
+    total = len(rows)
+    total_text = f"至少{total}行" if truncated else f"共{total}行"
+    if total == 0:
+        return convert_result_to_str(rows, columns)
+
+    rows = [tuple(_format_cell(v) for v in row) for row in rows]
+    if total <= head + tail:
+        return f"（{total_text}）\n" + convert_result_to_str(rows, columns)
+
+    omitted = total - head - tail
+    sampled = convert_result_to_str(rows[:head], columns) if head else (" | ".join(columns or []))
+    sampled += f"\n…… 省略{omitted}行 ……"
+    if tail:
+        sampled += "\n" + convert_result_to_str(rows[-tail:])
+    shown_text = f"显示前{head}行和后{tail}行" if head or tail else "未显示结果行"
+    return f"（{total_text}，{shown_text}）\n" + sampled
+
+
+def _format_cell(value):
+    """截断过长的单元格内容"""
+    if isinstance(value, str) and len(value) > MAX_CELL_CHARS:
+        return value[:MAX_CELL_CHARS] + "…"
+    return value
+
+
+def compact_analysis_context(schema_definition, student_query, answer_query, budget: int, fixed_text: str = "") -> dict:
+    """
+    生成分析提示中的模式定义和两份查询结果，从最详细的采样档位开始逐档降低，直到不超过token预算
+    参数：
+        schema_definition：模式定义
+        student_query：学生SQL的QueryResult，执行失败时可传入描述错误的字符串
+        answer_query：参考答案的QueryResult
+        budget：可变部分的token预算
+        fixed_text：不可压缩的其他可变内容（题目描述、SQL等），计入预算
+    返回：
+        dict：schema_definition、student_result、answer_result三项
+    """
+    fixed_tokens = estimate_tokens(fixed_text)
+    context = None
+    for head, tail, sample_rows in SAMPLING_LEVELS:
+        context = {
+            "schema_definition": render_schema(schema_definition, sample_rows),
+            "student_result": _render_query(student_query, head, tail),
+            "answer_result": _render_query(answer_query, head, tail),
+        }
+        if fixed_tokens + sum(estimate_tokens(v) for v in context.values()) <= budget:
+            break
+    return context
+
+
+def _render_query(query, head: int, tail: int) -> str:
+    if isinstance(query, str):
+        return query
+    return render_result(query.rows, query.columns, head, tail, query.truncated)
+
+
+def compact_schema(schema_definition, budget: int) -> str:
+    """
+    生成题目生成提示中的模式定义，示例数据逐档减少直到不超过token预算
+    """
+    text = ""
+    for _, _, sample_rows in SAMPLING_LEVELS:
+        text = render_schema(schema_definition, sample_rows)
+        if estimate_tokens(text) <= budget:
+            break
+    return text
+
+
+class PromptStats:
+    """按提示类型统计提示大小"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, kind: str, chars: int, tokens: int):
+        with self._lock:
+            stats = self._stats.setdefault(kind, {"count": 0, "total_tokens": 0, "max_tokens": 0, "last_tokens": 0, "last_chars": 0})
+            stats["count"] += 1
+            stats["total_tokens"] += tokens
+            stats["max_tokens"] = max(stats["max_tokens"], tokens)
+            stats["last_tokens"] = tokens
+            stats["last_chars"] = chars
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                kind: {**stats, "avg_tokens": stats["total_tokens"] / stats["count"]}
+                for kind, stats in self._stats.items()
+            }
+
+
+prompt_stats = PromptStats()
@@ -0,0 +1,209 @@
+"""
+批量重新判题模块，题目或模式修改后按批次流式读取历史练习记录，并行重新判题并批量更新
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import func, select, update
+from src import grading, models, schemas, validators
+from src.config import settings
+from src.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RegradeProgress:
+    """重新判题进度"""
+    job_id: str                                 # 任务id
+    question_id: Optional[str]                  # 范围：题目id
+    schema_id: Optional[str]                    # 范围：模式id（均为空时为整个题库）
+    status: str = "running"                     # running / done / failed
+    total: int = 0                              # 范围内的练习记录总数
+    processed: int = 0                          # 已处理数
+    changed: int = 0                            # 判题结果发生变化并已更新的数
+    skipped: int = 0                            # 因临时错误未更新的数
+    started_at: datetime = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+    def to_status(self) -> schemas.RegradeStatus:
+        end = self.finished_at or datetime.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return schemas.RegradeStatus(
+            job_id=self.job_id,
+            question_id=self.question_id,
+            schema_id=self.schema_id,
+            status=self.status,
+            total=self.total,
+            processed=self.processed,
+            changed=self.changed,
+            skipped=self.skipped,
+            elapsed_seconds=round(elapsed, 3),
+            throughput=round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            error=self.error
+        )
+
+
+def _scope_filter(query, question_id: str = None, schema_id: str = None):
+    if question_id is not None:
+        query = query.where(models.Attempt.question_id == question_id)
+    if schema_id is not None:
+        query = query.join(models.Question, models.Question.question_id == models.Attempt.question_id) \
+            .where(models.Question.schema_id == schema_id)
+    return query
+
+
+def regrade_attempts(progress: RegradeProgress, batch_size: int = None, workers: int = None):
+    """
+    重新判题：按题目顺序流式读取练习记录，每个题目先计算并缓存参考答案结果，再并行判题，
+    判题结论变化的记录按批次批量更新
+    参数：
+        progress：进度对象，执行过程中实时更新
+        batch_size：每批处理的记录数
+        workers：并行判题的线程数
+    """
+    batch_size = batch_size or settings.REGRADE_BATCH_SIZE
+    workers = workers or settings.REGRADE_WORKERS
+
+    read_db = SessionLocal()
+    write_db = SessionLocal()
+    questions: Dict[str, tuple] = {}
+    try:
+        progress.total = read_db.execute(
+            _scope_filter(select(func.count(models.Attempt.attempt_id)), progress.question_id, progress.schema_id)
+        ).scalar()
+
+        stmt = _scope_filter(
+            select(
+                models.Attempt.attempt_id,
+                models.Attempt.question_id,
+                models.Attempt.student_sql,
+                models.Attempt.is_correct,
+                models.Attempt.error_type,
+                models.Attempt.details
+            ),
+            progress.question_id,
+            progress.schema_id
+        ).order_by(models.Attempt.question_id)
+        rows = read_db.execute(stmt, execution_options={"yield_per": batch_size})
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="regrade") as executor:
+            for batch in rows.partitions(batch_size):
+                _regrade_batch(batch, questions, read_db, write_db, executor, progress)
+                logger.info(
+                    f"重新判题进度 {progress.processed}/{progress.total}，已更新 {progress.changed} 条"
+                )
+        progress.status = "done"
+    except Exception as e:
+        logger.error(f"重新判题失败: {str(e)}", exc_info=True)
+        write_db.rollback()
+        progress.status = "failed"
+        progress.error = str(e)
+    finally:
+        read_db.close()
+        write_db.close()
+        progress.finished_at = datetime.now()
+        status = progress.to_status()
+        logger.info(f"重新判题结束: 处理 {status.processed} 条，用时 {status.elapsed_seconds}s，{status.throughput} 条/秒")
+
+
+def _regrade_batch(batch, questions: dict, read_db, write_db, executor, progress: RegradeProgress):
+    """判一批记录并批量更新判题结果发生变化的记录"""
+    for row in batch:
+        if row.question_id not in questions:
+            question = read_db.get(models.Question, row.question_id)
+            schema = read_db.get(models.SampleSchema, question.schema_id) if question else None
+            questions[row.question_id] = (question, schema)
+            if question and schema:
+                # 每个题目先计算并缓存参考答案的结果和指纹，随后的并行判题只执行学生SQL
+                validators.warm_reference(
+                    question.answer_sql, schema.schema_definition, schema.schema_name,
+                    question.question_id, schema.schema_id, question.order_sensitive
+                )
+
+    def grade(row):
+        question, schema = questions[row.question_id]
+        if not (question and schema):
+            return row, None
+        # 沿用提交时的逐行差异设置，使重新判题结果与原记录的结构一致
+        return row, grading.grade_submission(question, schema, row.student_sql, row.details is not False)
+
+    updates: List[dict] = []
+    for row, result in executor.map(grade, batch):
+        progress.processed += 1
+        if result is None or result.error_type in grading.TRANSIENT_ERROR_TYPES:
+            progress.skipped += 1
+            continue
+        # 只比较判题结论，错误详情的结构或措辞变化不算作结果变化
+        if (result.is_correct, result.error_type) != (row.is_correct, row.error_type):
+            updates.append({
+                "attempt_id": row.attempt_id,
+                "is_correct": result.is_correct,
+                "error_type": result.error_type,
+                "detailed_errors": result.detailed_errors
+            })
+
+    if updates:
+        write_db.execute(update(models.Attempt), updates)
+        write_db.commit()
+        progress.changed += len(updates)
+
+
+# 重新判题任务，同一时间只在一个后台线程中顺序执行
+_jobs: Dict[str, RegradeProgress] = {}
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="regrade-job")
+
+
+def start_regrade(question_id: str = None, schema_id: str = None) -> RegradeProgress:
+    """
+    在后台启动重新判题任务
+    参数：
+        question_id：只重新判该题目的记录
+        schema_id：只重新判该模式下题目的记录
+    返回：
+        RegradeProgress：任务进度
+    """
+    progress = RegradeProgress(
+        job_id=str(uuid.uuid4()),
+        question_id=question_id,
+        schema_id=schema_id,
+        status="queued",
+        started_at=datetime.now()
+    )
+    with _jobs_lock:
+        _prune()
+        _jobs[progress.job_id] = progress
+
+    def run():
+        progress.status = "running"
+        progress.started_at = datetime.now()
+        regrade_attempts(progress)
+
+    _executor.submit(run)
+    return progress
+
+
+def get_regrade(job_id: str) -> Optional[RegradeProgress]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def _prune():
+    """清理超过保留时间的已完成任务（调用方需持有锁）"""
+    now = datetime.now()
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job.finished_at and (now - job.finished_at).total_seconds() > settings.REGRADE_JOB_TTL
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -1,19 +1,30 @@
+import json
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import create_engine, text
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from src import crud, llm_utils
+from src.attempt_analysis import build_analysis_inputs
+from src.llm_cache import analysis_cache, analysis_cache_key, store_analysis
+from src.llm_dispatcher import llm_dispatcher, LLMBusy, LLMUnavailable
 from src.database import get_db
-from src.config import settings
 from src import schemas
-from src.utils import convert_result_to_str
 
 router = APIRouter()
 
-@router.post("/sql")
-def analyze_sql(
-    attempt: schemas.Attempt,
-    db: Session = Depends(get_db),
-):
+# 流式输出的分析字段
+STREAM_FIELDS = ("correctness_analysis", "optimization_suggestions", "thinking_difference")
+
+
+def prepare_analysis(db: Session, attempt: schemas.Attempt):
+    """
+    查询题目，命中分析缓存时直接返回，否则执行两条SQL准备LLM分析所需的输入
+    参数：
+        db：数据库会话
+        attempt：提交记录
+    返回：
+        (cache_key, cached, inputs)：命中缓存时cached为已有分析、inputs为None，否则cached为None
+    """
     # 获取题目
     question = crud.get_question(db, attempt.question_id)
     if not question:
@@ -24,33 +35,95 @@ def analyze_sql(
     if not schema:
         raise HTTPException(status_code=404, detail="数据库模式未找到")
 
-    # 执行sql获得str结果
-    engine = create_engine(settings.DATABASE_URL)
-    with engine.connect() as conn:
-        conn.execute(text(f"SET search_path TO {schema.schema_name}"))
-        # 获得用户提交sql的str结果
-        student_result = conn.execute(text(attempt.student_sql)).fetchall()
-        student_columns = list(conn.execute(text(attempt.student_sql)).keys())
-        student_result_str = convert_result_to_str(student_result, student_columns)
+    # 相同题目下规范化后相同的提交直接复用已有分析
+    cache_key = analysis_cache_key(question.question_id, question.answer_sql, attempt.student_sql, attempt.is_correct)
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return cache_key, cached, None
+
+    inputs = build_analysis_inputs(
+        question.question_id,
+        question.description,
+        question.answer_sql,
+        schema.schema_definition,
+        schema.schema_name,
+        attempt.student_sql,
+        attempt.is_correct,
+        error_type=attempt.error_type,
+        detailed_errors=attempt.detailed_errors
+    )
+    return cache_key, None, inputs
 
-        # 获得参考答案sql的str结果
-        answer_result = conn.execute(text(question.answer_sql)).fetchall()
-        answer_columns = list(conn.execute(text(question.answer_sql)).keys())
-        answer_result_str = convert_result_to_str(answer_result, answer_columns)
 
+def sse_event(event: str, data) -> str:
+    """按Server-Sent Events格式编码一条事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    # 初始化LLMHelper
-    llm_helper = llm_utils.LLMHelper(settings.OPENAI_API_KEY, settings.MODEL_BASE_URL)
+
+@router.post("/sql")
+def analyze_sql(
+    attempt: schemas.Attempt,
+    db: Session = Depends(get_db),
+    llm_helper: llm_utils.LLMHelper = Depends(llm_utils.get_llm_helper),
+):
+    cache_key, cached, inputs = prepare_analysis(db, attempt)
+    if cached is not None:
+        return cached
 
     # 调用LLM进行分析
-    analysis_result = llm_helper.analyze_sql(
-        question_description=str(question.description),
-        schema_definition=str(schema.schema_definition),
-        student_sql=attempt.student_sql,
-        answer_sql=question.answer_sql,
-        student_result=student_result_str,
-        answer_result=answer_result_str,
-        is_correct=attempt.is_correct
-    )
+    analysis_result = llm_helper.analyze_sql(**inputs)
+    store_analysis(cache_key, analysis_result)
+
+    return analysis_result
+
 
-    return analysis_result
\ No newline at end of file
+@router.post("/sql/stream")
+async def analyze_sql_stream(
+    attempt: schemas.Attempt,
+    db: Session = Depends(get_db),
+    llm_helper: llm_utils.LLMHelper = Depends(llm_utils.get_llm_helper),
+):
+    """
+    流式分析，以text/event-stream返回：
+        delta事件：{"field": 字段名, "text": 新增文本}
+        done事件：完整分析结果
+        error事件：LLM调用失败时的占位结果，或排队失败时的{"detail", "retry_after"}
+    数据库查询在线程池中完成，LLM输出通过异步迭代转发，不占用工作线程
+    """
+    # 开始流式响应后无法再返回状态码，队列已满时提前拒绝
+    if llm_dispatcher.is_saturated():
+        raise LLMBusy(llm_dispatcher.retry_after)
+
+    cache_key, cached, inputs = await run_in_threadpool(prepare_analysis, db, attempt)
+
+    async def event_stream():
+        if cached is not None:
+            yield sse_event("done", cached)
+            return
+
+        sent = {field: "" for field in STREAM_FIELDS}
+        result = {}
+        try:
+            async for partial in llm_helper.astream_analysis(**inputs):
+                result = partial
+                for field in STREAM_FIELDS:
+                    text = partial.get(field)
+                    if isinstance(text, str) and len(text) > len(sent[field]):
+                        yield sse_event("delta", {"field": field, "text": text[len(sent[field]):]})
+                        sent[field] = text
+        except LLMUnavailable as e:
+            yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            llm_helper.logger.error(f"LLM流式分析失败: {str(e)}")
+            yield sse_event("error", llm_utils.analysis_failed_result())
+            return
+
+        store_analysis(cache_key, result)
+        yield sse_event("done", result)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,53 +1,108 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from src import crud, schemas, validators
-from src.database import get_db
-from src.security import get_current_user
+from src import crud, async_crud, schemas, regrade
+from src.config import settings
+from src.database import get_db, get_async_db
+from src.grading_queue import grading_queue, QueueFull, GradingError
+from src.security import get_current_user, get_current_user_async
 
 
 router = APIRouter()
 
-# 提交答案
+# 提交答案（同步接口，内部通过判题队列完成，等待期间不占用请求线程）
 @router.post("/submit", response_model=schemas.Attempt)
-def submit_answer(
+async def submit_answer(
         attempt_submit: schemas.AttemptSubmit,
-        db: Session = Depends(get_db),
-        current_user: schemas.User = Depends(get_current_user)
+        db: AsyncSession = Depends(get_async_db),
+        current_user: schemas.User = Depends(get_current_user_async)
 ):
-    question = crud.get_question(db, attempt_submit.question_id)
-    schema = crud.get_schema(db, question.schema_id)
+    if not await async_crud.get_question(db, attempt_submit.question_id):
+        raise HTTPException(status_code=404, detail="题目不存在")
+    job = enqueue_submission(attempt_submit, current_user)
+    try:
+        return await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(job.future)),
+            timeout=settings.GRADING_SUBMIT_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"判题超时，请稍后通过任务id查询结果: {job.job_id}"
+        )
+    except GradingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-    validation_result = validators.validate_sql(
-        student_sql=attempt_submit.student_sql,
-        answer_sql=question.answer_sql,
-        schema_definition=schema.schema_definition,
-        schema_name=schema.schema_name,
-        order_sensitive=question.order_sensitive
-    )
+# 异步提交答案，立即返回任务id
+@router.post("/jobs", response_model=schemas.GradingJobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def submit_answer_async(
+        attempt_submit: schemas.AttemptSubmit,
+        current_user: schemas.User = Depends(get_current_user_async)
+):
+    return enqueue_submission(attempt_submit, current_user).to_status()
 
-    # 创建练习记录
-    db_attempt = crud.create_attempt(db, schemas.AttemptCreate(
-        user_id=current_user.user_id,
-        question_id=attempt_submit.question_id,
-        student_sql=attempt_submit.student_sql,
-        is_correct=validation_result.is_correct,
-        error_type=validation_result.error_type,
-        detailed_errors=validation_result.detailed_errors
-    ))
-    return db_attempt
+# 查询判题任务状态，wait大于0时最多等待wait秒（长轮询）
+@router.get("/jobs/{job_id}", response_model=schemas.GradingJobStatus)
+async def get_grading_job(
+        job_id: str,
+        wait: float = 0,
+        current_user: schemas.User = Depends(get_current_user_async)
+):
+    job = grading_queue.get(job_id)
+    if not job or job.user_id != current_user.user_id:
+        raise HTTPException(status_code=404, detail="判题任务不存在")
+    if wait > 0 and not job.future.done():
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(job.future)),
+                timeout=min(wait, settings.GRADING_LONG_POLL_MAX)
+            )
+        except (asyncio.TimeoutError, GradingError):
+            pass    # 超时或任务失败时直接返回当前状态
+    return job.to_status()
+
+# 获取提交时请求的后台LLM分析，status为pending时表示尚未完成
+@router.get("/analysis/{attempt_id}", response_model=schemas.AttemptAnalysis)
+async def get_attempt_analysis(
+        attempt_id: str,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: schemas.User = Depends(get_current_user_async)
+):
+    row = await async_crud.get_attempt_analysis(db, attempt_id)
+    if not row or (current_user.role == "student" and row.user_id != current_user.user_id):
+        raise HTTPException(status_code=404, detail="分析不存在")
+    return row[0]
+
+def enqueue_submission(attempt_submit: schemas.AttemptSubmit, current_user: schemas.User):
+    """将提交放入判题队列，队列已满时返回503"""
+    try:
+        return grading_queue.submit(
+            current_user.user_id,
+            attempt_submit.question_id,
+            attempt_submit.student_sql,
+            attempt_submit.details,
+            attempt_submit.analyze
+        )
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
 
 # 获取练习历史
 @router.get("/history", response_model=List[schemas.Attempt])
-def get_attempt_history(
+async def get_attempt_history(
     user_id: str = None,
-    db: Session = Depends(get_db),
-    current_user: schemas.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(get_current_user_async)
 ):
     # 学生只能查看自己的历史
     if current_user.role == "student":
         user_id = current_user.user_id
-    return crud.get_user_attempts(db, user_id)
+    return await async_crud.get_user_attempts(db, user_id)
 
 @router.get("/all_history", response_model=List[schemas.AttemptWithUser])
 def get_all_history(
@@ -98,4 +153,32 @@ def get_attempts_by_question(
         db,
         question_id=question_id,
         user_id=current_user.user_id
-    )
\ No newline at end of file
+    )
+
+# 批量重新判题（教师权限），在后台执行并立即返回任务进度
+@router.post("/regrade", response_model=schemas.RegradeStatus, status_code=status.HTTP_202_ACCEPTED)
+def start_regrade(
+        request: schemas.RegradeRequest,
+        current_user: schemas.User = Depends(get_current_user)
+):
+    if current_user.role != "teacher":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="只有教师可以重新判题"
+        )
+    return regrade.start_regrade(request.question_id, request.schema_id).to_status()
+
+@router.get("/regrade/{job_id}", response_model=schemas.RegradeStatus)
+def get_regrade_status(
+        job_id: str,
+        current_user: schemas.User = Depends(get_current_user)
+):
+    if current_user.role != "teacher":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="只有教师可以查看重新判题进度"
+        )
+    progress = regrade.get_regrade(job_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="重新判题任务不存在")
+    return progress.to_status()
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from src import schemas
+from src.llm_dispatcher import llm_dispatcher
+from src.llm_metrics import llm_metrics
+from src.prompt_compaction import prompt_stats
+from src.security import get_current_user_async
+
+router = APIRouter()
+
+
+# LLM调用指标：排队情况、提示大小、调用耗时与token用量、各类缓存的命中率（仅教师可查看）
+@router.get("/llm")
+async def llm_metrics(current_user: schemas.User = Depends(get_current_user_async)):
+    if current_user.role != "teacher":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="只有教师可以查看运行指标"
+        )
+    return {
+        "dispatcher": llm_dispatcher.stats(),
+        "prompts": prompt_stats.snapshot(),
+        **llm_metrics.stats()
+    }
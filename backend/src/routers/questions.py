@@ -1,20 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from src import crud, schemas, llm_utils
-from src.database import get_db
-from src.security import get_current_user
+from src import crud, async_crud, schemas, llm_utils
 from src.config import settings
+from src.database import get_db, get_async_db
+from src.llm_dispatcher import Priority, LLMUnavailable
+from src.prompt_compaction import compact_schema
+from src.security import get_current_user
+from src.validators import check_answer_sql
 import src.models as models
 
 router = APIRouter()
 
+# 知识点白名单
+VALID_POINTS = ["basic_query", "where_clause", "aggregation", "group_by",
+                "order_by", "limit_clause", "joins", "subqueries",
+                "null_handling", "execution_order"]
+
 
 @router.post("/generate", response_model=schemas.Question)
 def generate_question(
         request_data: dict,  # 接收JSON请求体
         db: Session = Depends(get_db),
-        current_user: schemas.User = Depends(get_current_user)
+        current_user: schemas.User = Depends(get_current_user),
+        llm_helper: llm_utils.LLMHelper = Depends(llm_utils.get_llm_helper)
 ):
 
     # 权限验证
@@ -28,11 +39,8 @@ def generate_question(
         raise HTTPException(status_code=400, detail="缺少必要参数: knowledge_point或schema_id")
 
     # 知识点有效性检查
-    valid_points = ["basic_query", "where_clause", "aggregation", "group_by",
-                    "order_by", "limit_clause", "joins", "subqueries",
-                    "null_handling", "execution_order"]
     for point in knowledge_points:
-        if point not in valid_points:
+        if point not in VALID_POINTS:
             raise HTTPException(400, detail=f"无效的知识点: {point}")
 
     # 获取数据库模式
@@ -41,12 +49,13 @@ def generate_question(
         raise HTTPException(status_code=404, detail="数据库模式未找到")
 
     # 调用LLM生成题目
-    llm_helper = llm_utils.LLMHelper(settings.OPENAI_API_KEY, settings.MODEL_BASE_URL)
     try:
         generated = llm_helper.generate_question(
-            str(schema.schema_definition),
+            compact_schema(schema.schema_definition, settings.LLM_PROMPT_TOKEN_BUDGET),
             knowledge_points  # 传递列表而非单个知识点
         )
+    except LLMUnavailable:
+        raise       # 由全局异常处理器返回503/504和Retry-After
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM生成失败: {str(e)}")
 
@@ -60,22 +69,88 @@ def generate_question(
     }
     return crud.create_question(db, schemas.QuestionCreate(**question_data))
 
-@router.get("/get")
-def get_questions(
+@router.post("/generate/batch", response_model=schemas.QuestionBatchReport)
+def generate_questions_batch(
+        request: schemas.QuestionBatchGenerate,
+        db: Session = Depends(get_db),
+        current_user: schemas.User = Depends(get_current_user),
+        llm_helper: llm_utils.LLMHelper = Depends(llm_utils.get_llm_helper)
+):
+    """
+    按多组知识点并发生成题目，参考答案在样例模式上执行通过后才入库（一个事务批量插入）
+    """
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="只有教师可以生成题目")
+
+    if not request.combinations:
+        raise HTTPException(status_code=400, detail="缺少必要参数: combinations")
+    if len(request.combinations) > settings.QUESTION_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多生成{settings.QUESTION_BATCH_MAX_ITEMS}道题")
+    for points in request.combinations:
+        if not points:
+            raise HTTPException(status_code=400, detail="知识点组合不能为空")
+        for point in points:
+            if point not in VALID_POINTS:
+                raise HTTPException(400, detail=f"无效的知识点: {point}")
+
+    schema = crud.get_schema(db, request.schema_id)
+    if not schema:
+        raise HTTPException(status_code=404, detail="数据库模式未找到")
+    schema_definition = schema.schema_definition
+    schema_name = schema.schema_name
+    schema_prompt = compact_schema(schema_definition, settings.LLM_PROMPT_TOKEN_BUDGET)
+
+    def generate_one(index: int, points: List[str]):
+        """生成并校验一道题，返回(报告项, 待入库题目)"""
+        item = schemas.QuestionBatchItem(index=index, knowledge_points=points, status="generation_failed")
+        try:
+            generated = llm_helper.generate_question(schema_prompt, points, priority=Priority.BATCH)
+        except LLMUnavailable as e:
+            item.error = str(e)
+            return item, None
+        if not generated.get("answer_sql"):
+            item.error = generated.get("description") or "题目生成失败"
+            return item, None
+
+        error = check_answer_sql(generated["answer_sql"], schema_definition, schema_name,
+                                 settings.QUESTION_VALIDATION_TIMEOUT_MS)
+        if error:
+            item.status = "validation_failed"
+            item.error = error
+            return item, None
+
+        return item, schemas.QuestionCreate(
+            question_title=generated["question_title"],
+            description=generated["description"],
+            answer_sql=generated["answer_sql"],
+            schema_id=request.schema_id,
+            **{point: True for point in points}
+        )
+
+    with ThreadPoolExecutor(max_workers=settings.QUESTION_BATCH_CONCURRENCY) as executor:
+        results = list(executor.map(generate_one, range(len(request.combinations)), request.combinations))
+
+    items = [item for item, _ in results]
+    passed = [(item, question) for item, question in results if question is not None]
+    if passed:
+        created = crud.create_questions_bulk(db, [question for _, question in passed])
+        for (item, _), db_question in zip(passed, created):
+            item.status = "created"
+            item.question = schemas.Question.model_validate(db_question)
+
+    return schemas.QuestionBatchReport(total=len(items), created=len(passed), items=items)
+
+@router.get("/get", response_model=List[schemas.Question])
+async def get_questions(
     point: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if point:
         # 知识点白名单检查
-        valid_points = [
-            "basic_query", "where_clause", "aggregation", "group_by",
-            "order_by", "limit_clause", "joins", "subqueries",
-            "null_handling", "execution_order"
-        ]
-        if point not in valid_points:
+        if point not in VALID_POINTS:
             raise HTTPException(400, "无效的知识点")
-        return crud.get_questions_by_knowledge_point(db, point)
-    return crud.get_questions(db)
+        return await async_crud.get_questions_by_knowledge_point(db, point)
+    return await async_crud.get_questions(db)
 
 # 根据question_id查找question
 @router.get("/get/{question_id}", response_model=schemas.Question)
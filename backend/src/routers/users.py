@@ -39,7 +39,7 @@ def login_user(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=schemas.User)
-def get_current_user(
-    current_user: schemas.User = Depends(security.get_current_user)
+async def get_current_user(
+    current_user: schemas.User = Depends(security.get_current_user_async)
 ):
     return current_user
\ No newline at end of file
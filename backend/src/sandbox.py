@@ -0,0 +1,279 @@
+"""
+沙箱查询执行模块，在判题连接上执行SQL并一次性获取结果行、列名和耗时
+"""
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, fields, replace
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from src.config import settings
+from src.utils import estimate_size
+
+
+class ResultTooLarge(Exception):
+    """查询结果超出行数或内存预算"""
+
+    def __init__(self, rows_read: int, bytes_read: int, max_rows: int, max_bytes: int):
+        self.rows_read = rows_read
+        self.bytes_read = bytes_read
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        super().__init__(f"查询结果超出限制（最多{max_rows}行、{max_bytes}字节）")
+
+    def to_error(self, message: str, sql: str) -> dict:
+        """转换为detailed_errors中的结构化错误"""
+        return {
+            "error_type": "result_too_large",
+            "message": message,
+            "sql": sql,
+            "rows_read": self.rows_read,
+            "max_rows": self.max_rows,
+            "max_bytes": self.max_bytes
+        }
+
+
+# PostgreSQL中表示查询被超时取消的错误码：语句超时、锁等待超时、事务空闲超时
+TIMEOUT_PGCODES = {"57014", "55P03", "25P03"}
+
+
+def is_timeout_error(exc: Exception) -> bool:
+    """判断数据库异常是否由超时限制触发"""
+    return getattr(getattr(exc, "orig", None), "pgcode", None) in TIMEOUT_PGCODES
+
+
+@dataclass(frozen=True)
+class ExecutionLimits:
+    """单次沙箱执行的资源限制"""
+    statement_timeout_ms: int               # 语句超时（毫秒）
+    lock_timeout_ms: int                    # 锁等待超时（毫秒）
+    work_mem: str                           # 排序、哈希可使用的内存
+    idle_in_transaction_timeout_ms: int     # 事务空闲超时（毫秒）
+    max_rows: int                           # 最多读取的行数
+    max_bytes: int                          # 结果最多占用的内存字节数
+    max_plan_cost: Optional[float] = None   # EXPLAIN预估总代价上限
+    max_plan_rows: Optional[float] = None   # EXPLAIN预估结果行数上限
+
+    @property
+    def admission_enabled(self) -> bool:
+        """是否需要在执行前做代价检查"""
+        return self.max_plan_cost is not None or self.max_plan_rows is not None
+
+
+def default_limits() -> ExecutionLimits:
+    """由全局配置构造默认资源限制"""
+    return ExecutionLimits(
+        statement_timeout_ms=settings.SANDBOX_STATEMENT_TIMEOUT_MS,
+        lock_timeout_ms=settings.SANDBOX_LOCK_TIMEOUT_MS,
+        work_mem=settings.SANDBOX_WORK_MEM,
+        idle_in_transaction_timeout_ms=settings.SANDBOX_IDLE_IN_TRANSACTION_TIMEOUT_MS,
+        max_rows=settings.MAX_ROWS,
+        max_bytes=settings.MAX_RESULT_BYTES,
+        max_plan_cost=settings.SANDBOX_MAX_PLAN_COST,
+        max_plan_rows=settings.SANDBOX_MAX_PLAN_ROWS
+    )
+
+
+def resolve_limits(schema_definition: dict = None, question_id: str = None) -> ExecutionLimits:
+    """
+    合并全局、模式级和题目级的资源限制，后者优先
+    模式定义中的格式：
+        {"execution_limits": {"statement_timeout_ms": 2000, "questions": {"<question_id>": {"max_rows": 50}}}}
+    参数：
+        schema_definition：模式定义
+        question_id：题目id
+    返回：
+        ExecutionLimits：生效的资源限制
+    """
+    limits = default_limits()
+    config = (schema_definition or {}).get("execution_limits") or {}
+    names = {f.name for f in fields(ExecutionLimits)}
+    overrides = [config]
+    if question_id is not None:
+        overrides.append((config.get("questions") or {}).get(question_id) or {})
+    for override in overrides:
+        limits = replace(limits, **{k: v for k, v in override.items() if k in names})
+    return limits
+
+
+@contextmanager
+def governed_transaction(conn: Connection, limits: ExecutionLimits):
+    """
+    在只读事务中应用资源限制，退出时回滚事务，所有SET LOCAL设置随之失效
+    参数：
+        conn：数据库连接（尚未开始事务）
+        limits：资源限制
+    """
+    trans = conn.begin()
+    try:
+        conn.execute(text("SET TRANSACTION READ ONLY"))
+        conn.execute(
+            text(
+                "SELECT set_config('statement_timeout', :statement_timeout, true), "
+                "set_config('lock_timeout', :lock_timeout, true), "
+                "set_config('work_mem', :work_mem, true), "
+                "set_config('idle_in_transaction_session_timeout', :idle_timeout, true)"
+            ),
+            {
+                "statement_timeout": str(limits.statement_timeout_ms),
+                "lock_timeout": str(limits.lock_timeout_ms),
+                "work_mem": str(limits.work_mem),
+                "idle_timeout": str(limits.idle_in_transaction_timeout_ms)
+            }
+        )
+        yield conn
+    finally:
+        if trans.is_active:
+            trans.rollback()
+
+
+@dataclass
+class QueryResult:
+    """单次查询的执行结果"""
+    columns: List[str]                      # 结果列名
+    rows: List[tuple]                       # 结果行
+    elapsed_ms: float                       # 执行耗时（毫秒）
+    truncated: bool = False                 # 结果是否因超出预算被截断
+    bytes_read: int = 0                     # 结果占用的内存字节数（估算）
+
+
+def execute_query(
+        conn: Connection,
+        sql: str,
+        max_rows: int = None,
+        max_bytes: int = None,
+        truncate: bool = False
+) -> QueryResult:
+    """
+    使用服务端游标执行SQL，按批次流式读取结果，并从同一个游标中获取列名
+    参数：
+        conn：数据库连接
+        sql：要执行的查询语句
+        max_rows：最多读取的行数，默认为settings.MAX_ROWS
+        max_bytes：结果最多占用的内存字节数，默认为settings.MAX_RESULT_BYTES
+        truncate：超出预算时是否截断结果而不是抛出ResultTooLarge
+    返回：
+        QueryResult：查询结果
+    """
+    max_rows = settings.MAX_ROWS if max_rows is None else max_rows
+    max_bytes = settings.MAX_RESULT_BYTES if max_bytes is None else max_bytes
+    chunk_size = settings.FETCH_CHUNK_SIZE
+
+    start = time.perf_counter()
+    result = conn.execute(
+        text(sql),
+        execution_options={"stream_results": True, "max_row_buffer": chunk_size}
+    )
+    try:
+        columns = list(result.keys())
+        rows = []
+        bytes_read = 0
+        truncated = False
+        while not truncated:
+            chunk = result.fetchmany(chunk_size)
+            if not chunk:
+                break
+            for row in chunk:
+                row = tuple(row)
+                row_size = estimate_size(row)
+                if len(rows) >= max_rows or bytes_read + row_size > max_bytes:
+                    if not truncate:
+                        raise ResultTooLarge(len(rows) + 1, bytes_read + row_size, max_rows, max_bytes)
+                    truncated = True
+                    break
+                rows.append(row)
+                bytes_read += row_size
+    finally:
+        result.close()      # 提前结束时关闭服务端游标，不再读取剩余结果
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return QueryResult(columns=columns, rows=rows, elapsed_ms=elapsed_ms, truncated=truncated, bytes_read=bytes_read)
+
+
+@dataclass(frozen=True)
+class ResultFingerprint:
+    """由数据库计算的结果指纹，与行顺序无关"""
+    columns: tuple                          # 结果列名
+    column_types: tuple                     # 结果列的类型OID
+    row_count: int                          # 结果行数
+    digest: str                             # 对各行文本哈希排序后再聚合的哈希
+
+
+def fingerprint_query(conn: Connection, sql: str) -> ResultFingerprint:
+    """
+    在数据库端计算查询结果的指纹，不向应用传输结果行
+    各行先转换为PostgreSQL的规范文本表示并取md5，排序后聚合，重复行会多次计入
+    指纹只用于确认结果一致：列名、列类型和各行文本都相同时结果必然相等；指纹不同时结果仍可能在
+    进程内比较中相等（如numeric的2.50与2.5、numeric与float），需由完整比较判定
+    参数：
+        conn：数据库连接
+        sql：单条查询语句
+    返回：
+        ResultFingerprint：结果指纹
+    """
+    inner = sql.strip().rstrip(";")
+    probe = conn.execute(text(f"SELECT * FROM ({inner}) AS _q LIMIT 0"))
+    columns = tuple(probe.keys())
+    column_types = tuple(column[1] for column in probe.cursor.description)
+    probe.close()
+    row_count, digest = conn.execute(text(
+        "SELECT count(*), md5(coalesce(string_agg(_f._h, ',' ORDER BY _f._h), '')) "
+        f"FROM (SELECT md5(ROW(_q.*)::text) AS _h FROM ({inner}) AS _q) AS _f"
+    )).one()
+    return ResultFingerprint(columns=columns, column_types=column_types, row_count=row_count, digest=digest)
+
+
+def count_query(conn: Connection, sql: str) -> int:
+    """
+    在数据库端完整执行查询并返回结果行数，不向应用传输结果行
+    参数：
+        conn：数据库连接
+        sql：单条查询语句
+    返回：
+        int：结果行数
+    """
+    inner = sql.strip().rstrip(";")
+    return conn.execute(text(f"SELECT count(*) FROM ({inner}) AS _q")).scalar()
+
+
+@dataclass(frozen=True)
+class PlanSummary:
+    """EXPLAIN执行计划的摘要"""
+    node_type: str                          # 顶层节点类型
+    total_cost: float                       # 预估总代价
+    plan_rows: float                        # 预估结果行数
+    plan_width: int                         # 预估行宽（字节）
+
+    def exceeds(self, limits: ExecutionLimits) -> bool:
+        """预估代价或行数是否超出限制"""
+        return (limits.max_plan_cost is not None and self.total_cost > limits.max_plan_cost) or \
+            (limits.max_plan_rows is not None and self.plan_rows > limits.max_plan_rows)
+
+    def to_dict(self) -> dict:
+        return {
+            "node_type": self.node_type,
+            "total_cost": self.total_cost,
+            "plan_rows": self.plan_rows,
+            "plan_width": self.plan_width
+        }
+
+
+def explain_query(conn: Connection, sql: str) -> PlanSummary:
+    """
+    使用EXPLAIN (FORMAT JSON)获取查询的预估执行计划，不执行查询
+    参数：
+        conn：数据库连接
+        sql：单条查询语句
+    返回：
+        PlanSummary：执行计划摘要
+    """
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]["Plan"]
+    return PlanSummary(
+        node_type=root.get("Node Type", ""),
+        total_cost=float(root.get("Total Cost", 0)),
+        plan_rows=float(root.get("Plan Rows", 0)),
+        plan_width=int(root.get("Plan Width", 0))
+    )
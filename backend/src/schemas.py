@@ -92,6 +92,25 @@ class Question(QuestionBase):
     class Config:
         from_attributes = True
 
+class QuestionBatchGenerate(BaseModel):
+    """批量生成题目"""
+    schema_id: str                          # 样例模式id
+    combinations: List[List[str]]           # 知识点组合，每个组合生成一道题
+
+class QuestionBatchItem(BaseModel):
+    """批量生成中单道题的结果"""
+    index: int                              # 在请求中的序号
+    knowledge_points: List[str]             # 知识点组合
+    status: str                             # created / generation_failed / validation_failed
+    question: Optional[Question] = None     # 入库的题目
+    error: Optional[str] = None             # 失败原因
+
+class QuestionBatchReport(BaseModel):
+    """批量生成报告"""
+    total: int                              # 请求的题目数
+    created: int                            # 成功入库的题目数
+    items: List[QuestionBatchItem]          # 逐项结果
+
 
 
 
@@ -108,11 +127,14 @@ class AttemptSubmit(BaseModel):
     """提交答案（练习）"""
     student_sql: str                        # 提交的sql
     question_id: str                        # 问题id
+    details: bool = True                    # 答案错误时是否需要逐行差异，为False时只返回行数等摘要
+    analyze: bool = False                   # 是否在后台生成LLM分析，完成后通过/attempts/analysis/{attempt_id}获取
 
 class AttemptCreate(AttemptBase):
     """创建答案（练习）"""
     user_id: str                            # 用户id
     question_id: str                        # 问题id
+    details: bool = True                    # 提交时是否要求逐行差异
 
 class Attempt(AttemptBase):
     """答案（练习）类"""
@@ -128,6 +150,46 @@ class AttemptWithUser(Attempt):
     """带用户名的Attempt"""
     username: str
 
+class AttemptAnalysis(BaseModel):
+    """练习的LLM分析"""
+    attempt_id: str                         # 练习id
+    status: str                             # pending / done / failed
+    analysis: Optional[dict] = None         # 分析结果，字段同/analyze/sql的返回
+    error: Optional[str] = None             # 失败原因
+    created_at: datetime                    # 创建时间
+    finished_at: Optional[datetime] = None  # 完成时间
+
+    class Config:
+        from_attributes = True
+
+class GradingJobStatus(BaseModel):
+    """异步判题任务状态"""
+    job_id: str                             # 任务id
+    status: str                             # queued / running / done / failed
+    attempt: Optional[Attempt] = None       # 判题完成后的练习记录
+    error: Optional[str] = None             # 失败原因
+    submitted_at: datetime                  # 提交时间
+    finished_at: Optional[datetime] = None  # 完成时间
+
+class RegradeRequest(BaseModel):
+    """重新判题范围，均为空时重新判整个题库"""
+    question_id: Optional[str] = None       # 只重新判该题目
+    schema_id: Optional[str] = None         # 只重新判该模式下的题目
+
+class RegradeStatus(BaseModel):
+    """重新判题任务进度"""
+    job_id: str                             # 任务id
+    question_id: Optional[str] = None
+    schema_id: Optional[str] = None
+    status: str                             # queued / running / done / failed
+    total: int                              # 范围内的练习记录总数
+    processed: int                          # 已处理数
+    changed: int                            # 判题结果变化并已更新的数
+    skipped: int                            # 因临时错误未更新的数
+    elapsed_seconds: float                  # 已用时间（秒）
+    throughput: float                       # 处理速度（条/秒）
+    error: Optional[str] = None             # 失败原因
+
 
 
 
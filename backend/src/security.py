@@ -4,11 +4,12 @@
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
-from src import crud
-from src.database import get_db
+from src import crud, async_crud
+from src.database import get_db, get_async_db
 from src.config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")              # 定义了OAuth2密码流程的令牌获取URL
@@ -28,36 +29,64 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)  # 使用密钥和算法编码token
     return encoded_jwt
 
-def verify_token(token: str, db: Session):
+def credentials_exception():
+    """凭证无效时抛出的异常"""
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="无效凭证",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def decode_token(token: str) -> str:
     """
-    验证令牌
+    解码令牌
 
     参数：
         token: 输入的令牌
-        db: 数据库
 
     返回：
-        models.User: 通过验证的用户实例
+        str: 令牌中的用户名
     """
-    # 定义异常模板
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="无效凭证",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
     try:
-        # 解码令牌
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise credentials_exception()
+    return username
+
+def verify_token(token: str, db: Session):
+    """
+    验证令牌
+
+    参数：
+        token: 输入的令牌
+        db: 数据库
 
+    返回：
+        models.User: 通过验证的用户实例
+    """
     # 查询具体用户，得到用户实例
-    user = crud.get_user_by_username(db, username=username)
+    user = crud.get_user_by_username(db, username=decode_token(token))
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
+    return user
+
+async def verify_token_async(token: str, db: AsyncSession):
+    """
+    验证令牌（异步查询用户）
+
+    参数：
+        token: 输入的令牌
+        db: 异步数据库会话
+
+    返回：
+        models.User: 通过验证的用户实例
+    """
+    user = await async_crud.get_user_by_username(db, username=decode_token(token))
+    if user is None:
+        raise credentials_exception()
     return user
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -71,6 +100,17 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     """
     return verify_token(token, db)
 
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """
+    获取当前的用户（异步依赖项，供异步路由使用）
+    参数：
+        token: 用户令牌
+        db: 异步数据库会话
+    返回：
+        models.User: 用户实例
+    """
+    return await verify_token_async(token, db)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
@@ -0,0 +1,77 @@
+"""
+SQL解析模块，对SQL只做一次词法解析，统一提供语句数量、语句类型、表、列和别名等信息，并按SQL哈希缓存
+"""
+from functools import cached_property
+from typing import Dict, List, Tuple
+import sqlparse
+from sqlparse import tokens as T
+from sql_metadata import Parser
+from src.config import settings
+from src.grading_cache import LRUCache, sql_hash
+
+
+def _is_blank(statement) -> bool:
+    """语句是否只包含空白和注释"""
+    return all(token.is_whitespace or token.ttype in T.Comment for token in statement.flatten())
+
+
+class SQLAnalysis:
+    """一段SQL文本的解析结果，表和列等元数据在首次访问时提取"""
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        parsed = [statement for statement in sqlparse.parse(sql) if not _is_blank(statement)]
+        self.statements: Tuple[str, ...] = tuple(str(statement).strip() for statement in parsed)    # 各条语句文本
+        self.statement_types: Tuple[str, ...] = tuple(statement.get_type() for statement in parsed)  # 各条语句类型
+
+    @property
+    def statement_count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def statement_type(self) -> str:
+        """第一条语句的类型，如SELECT、INSERT，无法识别时为UNKNOWN"""
+        return self.statement_types[0] if self.statement_types else "UNKNOWN"
+
+    @cached_property
+    def _metadata(self) -> Parser:
+        return Parser(self.sql)
+
+    @cached_property
+    def tables(self) -> List[str]:
+        """查询涉及的表"""
+        return self._metadata.tables
+
+    @cached_property
+    def columns(self) -> List[str]:
+        """查询引用的列（表别名已解析为表名）"""
+        return self._metadata.columns
+
+    @cached_property
+    def table_aliases(self) -> Dict[str, str]:
+        """表别名 -> 表名"""
+        return self._metadata.tables_aliases
+
+    @cached_property
+    def column_aliases(self) -> List[str]:
+        """查询中定义的列别名"""
+        return self._metadata.columns_aliases_names
+
+
+analysis_cache = LRUCache(settings.SQL_ANALYSIS_CACHE_MAX_ENTRIES, settings.SQL_ANALYSIS_CACHE_MAX_BYTES)
+
+
+def get_analysis(sql: str) -> SQLAnalysis:
+    """
+    获取SQL的解析结果，相同SQL只解析一次
+    参数：
+        sql：SQL文本
+    返回：
+        SQLAnalysis：解析结果
+    """
+    key = sql_hash(sql)
+    analysis = analysis_cache.get(key)
+    if analysis is None:
+        analysis = SQLAnalysis(sql)
+        analysis_cache.set(key, analysis)
+    return analysis
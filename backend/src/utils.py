@@ -1,4 +1,6 @@
+import hashlib
 import logging
+import sys
 import sqlparse
 from sql_metadata import Parser
 from sqlalchemy import create_engine, text, exc
@@ -37,4 +39,40 @@ def convert_result_to_str(result, columns=None):
 
         rows.append(" | ".join(row_data))
 
-    return header + "\n".join(rows)
\ No newline at end of file
+    return header + "\n".join(rows)
+
+
+def estimate_size(obj) -> int:
+    """
+    粗略估算对象占用的内存字节数（递归统计容器内的元素）
+    参数：
+        obj：任意对象
+    返回：
+        int：估算的字节数
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj))     # dataclass、pydantic模型等对象统计其属性
+    return size
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    规范化SQL文本：关键字大写、去除注释、合并空白、去掉末尾分号
+    参数：
+        sql：原始SQL
+    返回：
+        str：规范化后的SQL
+    """
+    # strip_whitespace只合并字符串字面量之外的空白，不会改变查询语义
+    formatted = sqlparse.format(sql, keyword_case="upper", strip_comments=True, strip_whitespace=True)
+    return formatted.strip().rstrip(";").strip()
+
+
+def sql_fingerprint(sql: str) -> str:
+    """计算规范化后SQL的指纹"""
+    return hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()
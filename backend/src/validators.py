@@ -1,9 +1,18 @@
 import logging
-import sqlparse
-from sql_metadata import Parser
-from sqlalchemy import create_engine, text, exc
+import sys
+from typing import Optional
 from src.schemas import SQLValidationResult
+from src.database import schema_pools
+from src import grading_cache
+from src.sandbox import (
+    execute_query, fingerprint_query, count_query, explain_query, PlanSummary, ResultTooLarge, QueryResult,
+    resolve_limits, governed_transaction, is_timeout_error
+)
+from src.comparison import compare_multisets
 from src.config import settings
+from src.catalog import get_catalog
+from src.sql_analysis import get_analysis
+from dataclasses import replace
 from decimal import Decimal
 
 logger = logging.getLogger(__name__)
@@ -14,14 +23,27 @@ def validate_sql(
         answer_sql: str,
         schema_definition: dict,
         schema_name: str,
-        order_sensitive: bool
+        order_sensitive: bool,
+        question_id: str = None,
+        schema_id: str = None,
+        details: bool = True,
+        fast_path: bool = None,
+        capture: dict = None
 ) -> SQLValidationResult:
+    """
+    验证学生SQL：语法检测、语义检测、执行并与参考答案比较结果
+    参数：
+        details：结果不一致时是否需要逐行差异；为False时只返回行数等摘要，不影响判题结果
+        fast_path：是否先比较数据库端结果指纹，默认为settings.GRADING_FINGERPRINT_FAST_PATH
+        capture：不为None时写入执行得到的结果（"student"、"answer"两项QueryResult），供后续分析复用；
+            指纹快速路径判为正确时不写入（学生结果与参考答案一致，分析时只需参考答案结果）
+    """
     detailed_errors = []
 
     # 1. 语法检测
     try:
-        parsed_student = sqlparse.parse(student_sql)
-        if not parsed_student:
+        analysis = get_analysis(student_sql)
+        if analysis.statement_count == 0:
             detailed_errors.append({
                 "error_type": "syntax_error",
                 "message": "无法解析SQL语句"
@@ -32,9 +54,14 @@ def validate_sql(
                 detailed_errors=detailed_errors
             )
 
-        # 检查是否为SELECT语句（安全性检查）
-        first_token = parsed_student[0].tokens[0].value.upper()
-        if first_token != "SELECT":
+        # 检查是否为单条SELECT语句（安全性检查）
+        if analysis.statement_count > 1:
+            detailed_errors.append({
+                "error_type": "security_error",
+                "message": "不允许提交多条语句",
+                "details": "只允许单条SELECT查询语句"
+            })
+        elif analysis.statement_type != "SELECT":
             detailed_errors.append({
                 "error_type": "security_error",
                 "message": "非法的非查询语句",
@@ -54,38 +81,33 @@ def validate_sql(
 
     # 2. 语义检测
     try:
-        # 提取可用表和列信息
-        table_details = {}
-        for table in schema_definition.get("tables", []):
-            full_name = table["name"]
-            simple_name = full_name.split('.')[-1]
-            table_details[full_name] = table
-            table_details[simple_name] = table
-            table_details[simple_name + "_columns"] = [col["name"] for col in table.get("columns", [])]
-            table_details[full_name + "_columns"] = [col["name"] for col in table.get("columns", [])]
-
-        parser = Parser(student_sql)
+        # 获取编译后的模式目录（按模式id和版本缓存）
+        catalog = get_catalog(schema_id, schema_definition, schema_name)
 
         # 表验证
         invalid_tables = []
-        for table in set(parser.tables):
+        from_tables = set()
+        for table in set(analysis.tables):
             if '.' in table:
                 schema_part, table_part = table.split('.', 1)
-                if schema_part != schema_name:
+                from_tables.add(table_part)
+                if schema_part.lower() != schema_name.lower():     # 未加引号的模式名不区分大小写
                     invalid_tables.append({
                         "table": table,
                         "reason": f"模式不匹配: '{schema_part}' ≠ '{schema_name}'"
                     })
-                elif table_part not in table_details:
+                elif not catalog.has_table(table_part):
                     invalid_tables.append({
                         "table": table,
                         "reason": f"表不存在: '{table_part}'"
                     })
-            elif table not in table_details:
-                invalid_tables.append({
-                    "table": table,
-                    "reason": f"表不存在: '{table}'"
-                })
+            else:
+                from_tables.add(table)
+                if not catalog.has_table(table):
+                    invalid_tables.append({
+                        "table": table,
+                        "reason": f"表不存在: '{table}'"
+                    })
 
         if invalid_tables:
             detailed_errors.append({
@@ -96,33 +118,27 @@ def validate_sql(
 
         # 列验证
         invalid_columns = []
-        referenced_tables = set()
-        for column_ref in parser.columns:
+        for column_ref in analysis.columns:
             if '.' in column_ref:
-                table_part, column_name = column_ref.split('.', 1)
-                referenced_tables.add(table_part)
-                if table_part not in table_details:
+                table_part, column_name = column_ref.rsplit('.', 1)
+                table_part = table_part.split('.')[-1]
+                if not catalog.has_table(table_part):
                     invalid_columns.append({
                         "column": column_ref,
                         "reason": f"关联表不存在: '{table_part}'"
                     })
-                elif column_name not in table_details[table_part + "_columns"]:
+                elif column_name != '*' and not catalog.has_column(table_part, column_name):
                     invalid_columns.append({
                         "column": column_ref,
                         "reason": f"列不存在: '{table_part}.{column_name}'"
                     })
-            else:
-                column_found = False
-                for table_name in referenced_tables:
-                    if column_ref in table_details.get(table_name + "_columns", []):
-                        column_found = True
-                        break
-                if not column_found:
-                    invalid_columns.append({
-                        "column": column_ref,
-                        "reason": "歧义的列引用",
-                        "suggestion": "请使用表名前缀明确指定列"
-                    })
+            elif column_ref != '*' and not (catalog.tables_with_column(column_ref) & from_tables):
+                # 通过列到表的反向索引检查该列是否属于查询涉及的某个表
+                invalid_columns.append({
+                    "column": column_ref,
+                    "reason": f"列不存在: '{column_ref}'",
+                    "suggestion": "请检查列名，或使用表名前缀明确指定列"
+                })
 
         if invalid_columns:
             detailed_errors.append({
@@ -149,33 +165,59 @@ def validate_sql(
             detailed_errors=detailed_errors
         )
 
-    # 3. 执行验证
-    engine = create_engine(settings.DATABASE_URL)
+    # 3. 执行验证（使用按模式划分的判题连接池，在受资源限制的只读事务中执行）
+    limits = resolve_limits(schema_definition, question_id)
     try:
-        with engine.connect() as conn:
-            # 设置当前schema
-            try:
-                conn.execute(text(f"SET search_path TO {schema_name}"))
-            except Exception as e:
-                detailed_errors.append({
-                    "error_type": "runtime_error",
-                    "message": f"设置搜索路径失败: {str(e)}"
-                })
-                return SQLValidationResult(
-                    is_correct=False,
-                    error_type="runtime_error",
-                    detailed_errors=detailed_errors
+        # 连接取自该模式专属的连接池，search_path已在连接建立时设置
+        with schema_pools.connect(schema_name) as conn, governed_transaction(conn, limits):
+            # 执行前的代价检查：预估代价或行数超出模式限制的查询不予执行
+            if limits.admission_enabled:
+                plan = explain_student_sql(conn, student_sql, schema_id)
+                if plan is not None and plan.exceeds(limits):
+                    detailed_errors.append({
+                        "error_type": "cost_rejected",
+                        "message": "查询预估代价超出限制，未执行",
+                        "plan": plan.to_dict(),
+                        "max_plan_cost": limits.max_plan_cost,
+                        "max_plan_rows": limits.max_plan_rows
+                    })
+                    return SQLValidationResult(
+                        is_correct=False,
+                        error_type="cost_rejected",
+                        detailed_errors=detailed_errors
+                    )
+
+            # 顺序不敏感题目先在数据库端比较结果指纹，答案正确时无需传输结果行
+            if fast_path is None:
+                fast_path = settings.GRADING_FINGERPRINT_FAST_PATH
+            if not order_sensitive and fast_path:
+                fast_result = fingerprint_fast_path(
+                    conn, student_sql, answer_sql, limits, question_id, schema_id
                 )
+                if fast_result is not None:
+                    return fast_result
 
-            # 执行学生SQL
+            # 执行参考答案SQL（提供题目id和模式id时优先读取缓存）
             try:
-                student_result = conn.execute(text(student_sql)).fetchall()
-                student_columns = list(conn.execute(text(student_sql)).keys())
+                reference = load_reference_result(conn, answer_sql, question_id, schema_id)
+                answer_result = list(reference.rows)
+                answer_columns = list(reference.columns)
+                if capture is not None:
+                    capture["answer"] = QueryResult(
+                        columns=answer_columns, rows=answer_result, elapsed_ms=0, bytes_read=reference.bytes_read
+                    )
             except Exception as e:
+                if is_timeout_error(e):
+                    detailed_errors.append(timeout_error("参考答案SQL执行超时", answer_sql, limits, e))
+                    return SQLValidationResult(
+                        is_correct=False,
+                        error_type="timeout_error",
+                        detailed_errors=detailed_errors
+                    )
                 detailed_errors.append({
                     "error_type": "execution_error",
-                    "message": "学生SQL执行失败",
-                    "sql": student_sql,
+                    "message": "参考答案SQL执行失败",
+                    "sql": answer_sql,
                     "error": str(e)
                 })
                 return SQLValidationResult(
@@ -184,15 +226,33 @@ def validate_sql(
                     detailed_errors=detailed_errors
                 )
 
-            # 执行参考答案SQL
+            # 执行学生SQL，结果预算至少能容纳参考答案的结果
+            max_rows, max_bytes = student_budget(limits, reference)
             try:
-                answer_result = conn.execute(text(answer_sql)).fetchall()
-                answer_columns = list(conn.execute(text(answer_sql)).keys())
+                student_query = execute_query(conn, student_sql, max_rows, max_bytes)
+                student_result = student_query.rows
+                student_columns = student_query.columns
+                if capture is not None:
+                    capture["student"] = student_query
+            except ResultTooLarge as e:
+                detailed_errors.append(e.to_error("学生SQL返回的结果过大", student_sql))
+                return SQLValidationResult(
+                    is_correct=False,
+                    error_type="result_too_large",
+                    detailed_errors=detailed_errors
+                )
             except Exception as e:
+                if is_timeout_error(e):
+                    detailed_errors.append(timeout_error("学生SQL执行超时", student_sql, limits, e))
+                    return SQLValidationResult(
+                        is_correct=False,
+                        error_type="timeout_error",
+                        detailed_errors=detailed_errors
+                    )
                 detailed_errors.append({
                     "error_type": "execution_error",
-                    "message": "参考答案SQL执行失败",
-                    "sql": answer_sql,
+                    "message": "学生SQL执行失败",
+                    "sql": student_sql,
                     "error": str(e)
                 })
                 return SQLValidationResult(
@@ -253,37 +313,41 @@ def validate_sql(
                         })
 
                 if mismatch_details:
-                    detailed_errors.append({
+                    error = {
                         "error_type": "result_mismatch",
-                        "message": "顺序敏感模式结果不匹配",
-                        "comparison_details": mismatch_details
-                    })
+                        "message": "顺序敏感模式结果不匹配"
+                    }
+                    if details:
+                        error["comparison_details"] = mismatch_details
+                    else:
+                        error["mismatch_count"] = len(mismatch_details)
+                    detailed_errors.append(error)
 
             # 顺序不敏感查询的验证
             else:
-                # 使用集合操作验证结果
+                # 在进程内以哈希多重集比较结果，重复行的次数也参与比较
                 try:
-                    # 创建临时视图
-                    conn.execute(text(f"""
-                        CREATE TEMPORARY VIEW student_results AS {student_sql};
-                        CREATE TEMPORARY VIEW answer_results AS {answer_sql};
-                    """))
-
-                    # 检查差异
-                    diff_result = conn.execute(text("""
-                        (SELECT * FROM student_results EXCEPT SELECT * FROM answer_results)
-                        UNION ALL
-                        (SELECT * FROM answer_results EXCEPT SELECT * FROM student_results)
-                    """)).fetchall()
-
-                    if diff_result:
-                        diff_dicts = [dict(row._mapping) for row in diff_result]
-                        detailed_errors.append({
+                    diff = compare_multisets(
+                        student_result,
+                        answer_result,
+                        student_columns,
+                        answer_columns,
+                        settings.COMPARISON_MAX_DIFF_ROWS
+                    )
+                    if not diff.is_equal:
+                        error = {
                             "error_type": "result_mismatch",
                             "message": "顺序不敏感模式结果不匹配",
-                            "differences": diff_dicts,
-                            "difference_count": len(diff_result)
-                        })
+                            "student_rows": len(student_result),
+                            "answer_rows": len(answer_result),
+                            "missing_count": diff.missing_count,
+                            "extra_count": diff.extra_count,
+                            "difference_count": diff.missing_count + diff.extra_count
+                        }
+                        if details:
+                            error["missing_rows"] = diff.missing_rows
+                            error["extra_rows"] = diff.extra_rows
+                        detailed_errors.append(error)
                 except Exception as e:
                     detailed_errors.append({
                         "error_type": "comparison_error",
@@ -317,6 +381,152 @@ def validate_sql(
             detailed_errors=detailed_errors
         )
 
+def check_answer_sql(answer_sql: str, schema_definition: dict, schema_name: str, timeout_ms: int = None) -> Optional[str]:
+    """
+    检查参考答案SQL能否在样例模式上正常执行（用于入库前校验生成的题目）
+    参数：
+        answer_sql：参考答案SQL
+        schema_definition：模式定义
+        schema_name：模式名称
+        timeout_ms：语句超时（毫秒），为空时使用模式的资源限制
+    返回：
+        str or None：失败原因，通过时返回None
+    """
+    if not answer_sql or not answer_sql.strip():
+        return "参考答案SQL为空"
+    analysis = get_analysis(answer_sql)
+    if analysis.statement_count != 1 or analysis.statement_type != "SELECT":
+        return "参考答案必须是单条SELECT语句"
+
+    limits = resolve_limits(schema_definition)
+    if timeout_ms is not None:
+        limits = replace(limits, statement_timeout_ms=min(limits.statement_timeout_ms, timeout_ms))
+    # 参考答案不受学生SQL的结果预算限制，只检查执行前的代价和执行超时；结果在数据库端计数，不传输结果行
+    try:
+        with schema_pools.connect(schema_name) as conn, governed_transaction(conn, limits):
+            if limits.admission_enabled:
+                plan = explain_query(conn, answer_sql)
+                if plan.exceeds(limits):
+                    return f"参考答案SQL预估代价超出限制（代价{plan.total_cost:.0f}，行数{plan.plan_rows:.0f}）"
+            count_query(conn, answer_sql)
+    except Exception as e:
+        if is_timeout_error(e):
+            return f"参考答案SQL执行超时（{limits.statement_timeout_ms}ms）"
+        return f"参考答案SQL执行失败: {str(e)}"
+    return None
+
+def load_reference_result(conn, answer_sql: str, question_id: str = None, schema_id: str = None) -> grading_cache.ReferenceResult:
+    """
+    读取参考答案的执行结果，未缓存时执行并写入缓存（提供题目id和模式id时才使用缓存）
+    参考答案由教师编写，不受学生SQL的结果预算限制，否则结果较大的题目对所有学生都无法判题
+    """
+    use_cache = question_id is not None and schema_id is not None
+    reference = grading_cache.get_reference_result(question_id, schema_id, answer_sql) if use_cache else None
+    if reference is None:
+        answer_query = execute_query(conn, answer_sql, sys.maxsize, sys.maxsize)
+        reference = grading_cache.ReferenceResult(
+            columns=tuple(answer_query.columns),
+            rows=tuple(answer_query.rows),
+            bytes_read=answer_query.bytes_read
+        )
+        if use_cache:
+            grading_cache.set_reference_result(question_id, schema_id, answer_sql, reference)
+    return reference
+
+def load_reference_fingerprint(conn, answer_sql: str, question_id: str = None, schema_id: str = None):
+    """读取参考答案的结果指纹，未缓存时在保存点中计算并写入缓存"""
+    use_cache = question_id is not None and schema_id is not None
+    reference = grading_cache.get_reference_fingerprint(question_id, schema_id, answer_sql) if use_cache else None
+    if reference is None:
+        with conn.begin_nested():
+            reference = fingerprint_query(conn, answer_sql)
+        if use_cache:
+            grading_cache.set_reference_fingerprint(question_id, schema_id, answer_sql, reference)
+    return reference
+
+def warm_reference(answer_sql: str, schema_definition: dict, schema_name: str, question_id: str, schema_id: str, order_sensitive: bool):
+    """
+    预先计算并缓存参考答案的结果（顺序不敏感题目同时计算结果指纹），供随后的并行判题复用
+    失败时只记录日志，由判题过程报告错误
+    """
+    limits = resolve_limits(schema_definition, question_id)
+    try:
+        with schema_pools.connect(schema_name) as conn, governed_transaction(conn, limits):
+            load_reference_result(conn, answer_sql, question_id, schema_id)
+            if not order_sensitive and settings.GRADING_FINGERPRINT_FAST_PATH:
+                load_reference_fingerprint(conn, answer_sql, question_id, schema_id)
+    except Exception as e:
+        logger.warning(f"参考答案预计算失败: question_id={question_id}, {str(e)}")
+
+def student_budget(limits, reference) -> tuple:
+    """
+    学生SQL的结果预算：取模式限制与参考答案结果规模中的较大者，正确答案的结果总能完整读取
+    （字节数留出一倍余量，同样的值在不同列类型下占用的内存不同）
+    返回：
+        tuple：(最多读取的行数, 最多占用的字节数)
+    """
+    return max(limits.max_rows, len(reference.rows)), max(limits.max_bytes, 2 * reference.bytes_read)
+
+def explain_student_sql(conn, student_sql: str, schema_id: str) -> Optional[PlanSummary]:
+    """
+    获取学生SQL的执行计划摘要，按(SQL指纹, 模式)缓存，重复提交无需再次EXPLAIN
+    返回：
+        PlanSummary or None：EXPLAIN失败时返回None，由执行阶段报告错误
+    """
+    plan = grading_cache.get_plan(schema_id, student_sql) if schema_id is not None else None
+    if plan is None:
+        try:
+            with conn.begin_nested():
+                plan = explain_query(conn, student_sql)
+        except Exception as e:
+            logger.debug(f"EXPLAIN失败，跳过代价检查: {str(e)}")
+            return None
+        if schema_id is not None:
+            grading_cache.set_plan(schema_id, student_sql, plan)
+    return plan
+
+def fingerprint_fast_path(conn, student_sql, answer_sql, limits, question_id, schema_id) -> Optional[SQLValidationResult]:
+    """
+    比较学生SQL和参考答案的结果指纹（在保存点中执行，失败不影响后续的完整比较）
+    返回：
+        SQLValidationResult or None：指纹一致时判为正确；学生SQL超时时判为超时；
+        其余情况（包括指纹不一致）返回None，由完整比较继续判题
+    """
+    try:
+        reference = load_reference_fingerprint(conn, answer_sql, question_id, schema_id)
+    except Exception as e:
+        logger.debug(f"参考答案指纹计算失败，改用完整比较: {str(e)}")
+        return None
+
+    try:
+        with conn.begin_nested():
+            student = fingerprint_query(conn, student_sql)
+    except Exception as e:
+        if is_timeout_error(e):
+            return SQLValidationResult(
+                is_correct=False,
+                error_type="timeout_error",
+                detailed_errors=[timeout_error("学生SQL执行超时", student_sql, limits, e)]
+            )
+        logger.debug(f"学生SQL指纹计算失败，改用完整比较: {str(e)}")
+        return None
+
+    # 指纹比进程内的规范化比较更严格，不一致时不能据此判错
+    if student == reference:
+        return SQLValidationResult(is_correct=True)
+    return None
+
+def timeout_error(message: str, sql: str, limits, error: Exception) -> dict:
+    """构造超时错误信息"""
+    return {
+        "error_type": "timeout_error",
+        "message": message,
+        "sql": sql,
+        "statement_timeout_ms": limits.statement_timeout_ms,
+        "lock_timeout_ms": limits.lock_timeout_ms,
+        "error": str(error)
+    }
+
 def convert_decimals(obj):
     """递归将Decimal类型转换为float"""
     if isinstance(obj, Decimal):
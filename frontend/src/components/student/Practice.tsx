@@ -115,6 +115,17 @@ const Practice: React.FC = () => {
       .map(point => point.label);
   };
 
+  // 轮询提交时请求的后台分析，完成后返回分析结果
+  const waitForAnalysis = async (attemptId: string) => {
+    for (let i = 0; i < 60; i++) {
+      const record = await api.get(`/attempts/analysis/${attemptId}`);
+      if (record.status === 'done') return record.analysis;
+      if (record.status === 'failed') break;
+      await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+    return null;
+  };
+
   const handleSubmit = async () => {
     if (!selectedQuestion || !sql.trim()) return;
     
@@ -122,11 +133,12 @@ const Practice: React.FC = () => {
     try {
       const attempt = await api.post('/attempts/submit', {
         student_sql: sql,
-        question_id: selectedQuestion.question_id
+        question_id: selectedQuestion.question_id,
+        analyze: true
       });
       
       setResult(attempt);
-      const analysisData = await api.post('/analyze/sql', attempt);
+      const analysisData = await waitForAnalysis(attempt.attempt_id);
       setAnalysis(analysisData);
     } catch (error) {
       console.error('提交失败', error);